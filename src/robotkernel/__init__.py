@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
-import pkg_resources
+try:
+    from importlib.metadata import version
+except ImportError:  # Python < 3.8
+    from pkg_resources import get_distribution
+
+    def version(name):
+        return get_distribution(name).version
 
 
 try:
@@ -11,4 +17,4 @@ try:
 except ImportError:
     pass
 
-__version__ = str(pkg_resources.get_distribution("robotkernel").version)
+__version__ = str(version("robotkernel"))
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from tempfile import TemporaryDirectory
+from typing import Optional
+from urllib.parse import quote
+import os
+import shutil
+import uuid
+
+
+PREFIX = "robotkernel-"
+
+
+def get_size(path: str) -> int:
+    """Return total size of files below path."""
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+class ArtifactStore:
+    """Size-bounded store for kept execution results with one directory per run."""
+
+    def __init__(self, path: Optional[str] = None, max_size: int = 0):
+        self.max_size = max_size
+        if path:
+            self.temporary = None
+            self.root = os.path.abspath(path)
+            self.path = os.path.join(self.root, f"{PREFIX}{uuid.uuid4()}")
+        else:
+            self.temporary = TemporaryDirectory(prefix=PREFIX)
+            self.root = self.path = self.temporary.name
+        os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def linkable(self) -> bool:
+        """Return True when results are kept to be linked from the notebook."""
+        return self.temporary is None
+
+    def add(self, name: str) -> str:
+        """Return new directory for the named run."""
+        dirname = os.path.join(self.path, name)
+        os.makedirs(dirname, exist_ok=True)
+        return dirname
+
+    def href(self, name: str, filename: str) -> str:
+        """Return link to the file of the named run relative to working directory."""
+        path = os.path.join(self.path, name, filename)
+        try:
+            path = os.path.relpath(path)
+        except ValueError:  # on different drive on Windows
+            pass
+        return quote(path.replace(os.path.sep, "/"))
+
+    def runs(self):
+        """Return directories of kept runs from the least recently modified."""
+        if self.temporary is not None:
+            kernels = [self.path]
+        else:  # only look into kernel directories to never remove anything else
+            kernels = [
+                path
+                for mtime, path in self.list(self.root)
+                if os.path.basename(path).startswith(PREFIX)
+            ]
+        runs = []
+        for path in kernels:
+            runs.extend(self.list(path))
+        return [path for mtime, path in sorted(runs)]
+
+    @staticmethod
+    def list(path: str):
+        """Return (mtime, path) for the subdirectories of path."""
+        results = []
+        try:
+            for entry in os.scandir(path):
+                if entry.is_dir():
+                    results.append((entry.stat().st_mtime, entry.path))
+        except OSError:  # removed by another kernel
+            pass
+        return results
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove least recently modified runs until within the size limit."""
+        if not self.max_size:
+            return
+        runs = [(run, get_size(run)) for run in self.runs()]
+        total = sum(size for run, size in runs)
+        for run, size in runs:
+            if total <= self.max_size:
+                break
+            if keep and run == os.path.join(self.path, keep):
+                continue
+            shutil.rmtree(run, ignore_errors=True)
+            total -= size
+            parent = os.path.dirname(run)
+            if parent != self.path:
+                try:
+                    os.rmdir(parent)  # only when empty
+                except OSError:
+                    pass
+
+    def cleanup(self):
+        """Remove temporary results. Linkable results are kept for the notebook."""
+        if self.temporary is not None:
+            self.temporary.cleanup()
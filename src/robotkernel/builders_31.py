@@ -17,8 +17,8 @@ import os
 import platform
 
 
-def build_suite(code: str, cell_history: Dict[str, str]):
-    # Init
+def build_suite(code: str, cell_history: Dict[str, str], cache: dict = None):
+    # Init (model cache is not supported with the legacy parser)
     data = TestCaseString()
     data.source = os.getcwd()  # allow Library and Resource from CWD work
 
@@ -7,6 +7,8 @@ from robot.running.builder.transformers import SuiteBuilder
 from robot.running.model import TestSuite
 from robotkernel.constants import HAS_RF61_PARSER
 from typing import Dict
+from typing import Optional
+import hashlib
 import os
 
 
@@ -34,11 +36,42 @@ def _get_rpa_mode(data):
     raise DataError("One file cannot have both tests and tasks.")
 
 
+def _get_model(
+    code: str,
+    data_only: bool = False,
+    cache: Optional[dict] = None,
+    key: Optional[str] = None,
+):
+    """Parse code into model, reusing the cached model of an unchanged cell.
+
+    The cache maps cell ids to (digest, model) tuples, so that it holds at
+    most one model per cell and a changed cell simply replaces its entry.
+    """
+    curdir = os.getcwd().replace("\\", "\\\\")
+    if cache is None or key is None:
+        ast = get_model(StringIO(code), data_only=data_only, curdir=curdir)
+        ErrorReporter(code).visit(ast)
+        return ast
+    digest = hashlib.sha1(f"{data_only}:{curdir}:{code}".encode("utf-8")).hexdigest()
+    cached = cache.get(key)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+    ast = get_model(StringIO(code), data_only=data_only, curdir=curdir)
+    ErrorReporter(code).visit(ast)
+    cache[key] = (digest, ast)
+    return ast
+
+
 # TODO: Refactor to use public API only
 # https://github.com/robotframework/robotframework/commit/fa024345cb58d154e1d8384552b62788d3ed6258
 
 
-def build_suite(code: str, cell_history: Dict[str, str], data_only: bool = False):
+def build_suite(
+    code: str,
+    cell_history: Dict[str, str],
+    data_only: bool = False,
+    cache: Optional[dict] = None,
+):
     # Init
     suite = TestSuite(name="Jupyter", source=os.getcwd())
     if HAS_RF61_PARSER:
@@ -46,14 +79,9 @@ def build_suite(code: str, cell_history: Dict[str, str], data_only: bool = False
     else:
         defaults = TestDefaults(None)
 
-    # Populate history
-    for historical in cell_history.values():
-        ast = get_model(
-            StringIO(historical),
-            data_only=data_only,
-            curdir=os.getcwd().replace("\\", "\\\\"),
-        )
-        ErrorReporter(historical).visit(ast)
+    # Populate history (parsing only new or changed cells)
+    for cell_id, historical in cell_history.items():
+        ast = _get_model(historical, data_only, cache, cell_id)
         SettingsBuilder(suite, defaults).visit(ast)
         SuiteBuilder(suite, defaults).visit(ast)
 
@@ -61,10 +89,7 @@ def build_suite(code: str, cell_history: Dict[str, str], data_only: bool = False
     suite.tests._items = []
 
     # Populate current
-    ast = get_model(
-        StringIO(code), data_only=data_only, curdir=os.getcwd().replace("\\", "\\\\")
-    )
-    ErrorReporter(code).visit(ast)
+    ast = _get_model(code, data_only)
     SettingsBuilder(suite, defaults).visit(ast)
     SuiteBuilder(suite, defaults).visit(ast)
 
@@ -1,27 +1,65 @@
 # -*- coding: utf-8 -*-
 from robot.libdocpkg.model import KeywordDoc
-import pkg_resources
+import base64
+import importlib.util
+import os
 import re
 
 
+# Detect features instead of versions to not import slow pkg_resources
 try:
-    pkg_resources.get_distribution("robotframework>=6.1b1")
+    from robot.running.builder.settings import FileSettings  # noqa: F401 RF >= 6.1
     HAS_RF61_PARSER = True
-except pkg_resources.VersionConflict:
+except ImportError:
     HAS_RF61_PARSER = False
 
 try:
-    pkg_resources.get_distribution("robotframework>=3.2a1")
+    from robot.api import get_model  # noqa: F401 RF >= 3.2
     HAS_RF32_PARSER = True
-except pkg_resources.VersionConflict:
+except ImportError:
     HAS_RF32_PARSER = False
 
-try:
-    pkg_resources.get_distribution("nbimporter")
-    HAS_NBIMPORTER = True
-except pkg_resources.DistributionNotFound:
-    HAS_NBIMPORTER = False
+HAS_NBIMPORTER = importlib.util.find_spec("nbimporter") is not None
 
+# Persistent library documentation cache shared by all kernels of the user
+# (set ROBOTKERNEL_LIBDOC_CACHE to an empty value to disable the cache)
+LIBDOC_CACHE_DIR = os.environ.get(
+    "ROBOTKERNEL_LIBDOC_CACHE",
+    os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache"),
+        "robotkernel",
+        "libdoc",
+    ),
+)
+# Display of log.html and report.html after execution: "embed" embeds them into
+# the notebook, "on-demand" keeps only output.xml and generates them on click
+REPORT_MODE = os.environ.get("ROBOTKERNEL_REPORT_MODE", "embed")
+# Execution of robot cells: "in-process" runs them in the kernel process,
+# "process" in a separate warm worker process, which is replaced when crashed
+EXECUTION_MODE = os.environ.get("ROBOTKERNEL_EXECUTION_MODE", "in-process")
+
+# Directory (relative to the notebook) to keep results in to only link them
+# from the notebook, and the size limit for all kept results in megabytes
+ARTIFACTS_DIR = os.environ.get("ROBOTKERNEL_ARTIFACTS_DIR", "")
+ARTIFACTS_MAX_SIZE = int(os.environ.get("ROBOTKERNEL_ARTIFACTS_MAX_SIZE", "500"))
+# Optional downscaling and re-encoding (e.g. "JPEG" or "WEBP") of screenshots
+# before embedding, and the size limit for cached encoded screenshots in bytes
+SCREENSHOT_MAX_WIDTH = int(os.environ.get("ROBOTKERNEL_SCREENSHOT_MAX_WIDTH", "0"))
+SCREENSHOT_FORMAT = os.environ.get("ROBOTKERNEL_SCREENSHOT_FORMAT", "").upper()
+SCREENSHOT_FORMAT = SCREENSHOT_FORMAT == "JPG" and "JPEG" or SCREENSHOT_FORMAT
+SCREENSHOT_QUALITY = int(os.environ.get("ROBOTKERNEL_SCREENSHOT_QUALITY", "80"))
+SCREENSHOT_CACHE_SIZE = 64 * 1024 * 1024
+# Maximum number of the best matching completions to return, and the number
+# of recent keyword searches to keep for narrowing while typing
+MAX_COMPLETIONS = 250
+COMPLETION_CACHE_SIZE = 32
+# Number of recently inspected keywords to keep rendered documentation for
+KEYWORD_DOC_CACHE_SIZE = 256
+# Seconds to wait for selector completion before replying with the results of
+# the same or a previous needle, while the completion continues in background
+SELECTOR_COMPLETION_TIMEOUT = float(
+    os.environ.get("ROBOTKERNEL_SELECTOR_COMPLETION_TIMEOUT", "2")
+)
 
 VARIABLE_REGEXP = re.compile(r"[$@&%]\{[\w\s]+\}")
 
@@ -315,4 +353,14 @@ __ http://robotframework.org/robotframework/latest/RobotFrameworkUserGuide.html#
 }
 CONTEXT_LIBRARIES["__settings__"].extend(CONTEXT_LIBRARIES["__root__"])
 
-THROBBER = "data:image/gif;base64,R0lGODlhIAAgAPMAAP///wAAAMbGxoSEhLa2tpqamjY2NlZWVtjY2OTk5Ly8vB4eHgQEBAAAAAAAAAAAACH/C05FVFNDQVBFMi4wAwEAAAAh/hpDcmVhdGVkIHdpdGggYWpheGxvYWQuaW5mbwAh+QQJCgAAACwAAAAAIAAgAAAE5xDISWlhperN52JLhSSdRgwVo1ICQZRUsiwHpTJT4iowNS8vyW2icCF6k8HMMBkCEDskxTBDAZwuAkkqIfxIQyhBQBFvAQSDITM5VDW6XNE4KagNh6Bgwe60smQUB3d4Rz1ZBApnFASDd0hihh12BkE9kjAJVlycXIg7CQIFA6SlnJ87paqbSKiKoqusnbMdmDC2tXQlkUhziYtyWTxIfy6BE8WJt5YJvpJivxNaGmLHT0VnOgSYf0dZXS7APdpB309RnHOG5gDqXGLDaC457D1zZ/V/nmOM82XiHRLYKhKP1oZmADdEAAAh+QQJCgAAACwAAAAAIAAgAAAE6hDISWlZpOrNp1lGNRSdRpDUolIGw5RUYhhHukqFu8DsrEyqnWThGvAmhVlteBvojpTDDBUEIFwMFBRAmBkSgOrBFZogCASwBDEY/CZSg7GSE0gSCjQBMVG023xWBhklAnoEdhQEfyNqMIcKjhRsjEdnezB+A4k8gTwJhFuiW4dokXiloUepBAp5qaKpp6+Ho7aWW54wl7obvEe0kRuoplCGepwSx2jJvqHEmGt6whJpGpfJCHmOoNHKaHx61WiSR92E4lbFoq+B6QDtuetcaBPnW6+O7wDHpIiK9SaVK5GgV543tzjgGcghAgAh+QQJCgAAACwAAAAAIAAgAAAE7hDISSkxpOrN5zFHNWRdhSiVoVLHspRUMoyUakyEe8PTPCATW9A14E0UvuAKMNAZKYUZCiBMuBakSQKG8G2FzUWox2AUtAQFcBKlVQoLgQReZhQlCIJesQXI5B0CBnUMOxMCenoCfTCEWBsJColTMANldx15BGs8B5wlCZ9Po6OJkwmRpnqkqnuSrayqfKmqpLajoiW5HJq7FL1Gr2mMMcKUMIiJgIemy7xZtJsTmsM4xHiKv5KMCXqfyUCJEonXPN2rAOIAmsfB3uPoAK++G+w48edZPK+M6hLJpQg484enXIdQFSS1u6UhksENEQAAIfkECQoAAAAsAAAAACAAIAAABOcQyEmpGKLqzWcZRVUQnZYg1aBSh2GUVEIQ2aQOE+G+cD4ntpWkZQj1JIiZIogDFFyHI0UxQwFugMSOFIPJftfVAEoZLBbcLEFhlQiqGp1Vd140AUklUN3eCA51C1EWMzMCezCBBmkxVIVHBWd3HHl9JQOIJSdSnJ0TDKChCwUJjoWMPaGqDKannasMo6WnM562R5YluZRwur0wpgqZE7NKUm+FNRPIhjBJxKZteWuIBMN4zRMIVIhffcgojwCF117i4nlLnY5ztRLsnOk+aV+oJY7V7m76PdkS4trKcdg0Zc0tTcKkRAAAIfkECQoAAAAsAAAAACAAIAAABO4QyEkpKqjqzScpRaVkXZWQEximw1BSCUEIlDohrft6cpKCk5xid5MNJTaAIkekKGQkWyKHkvhKsR7ARmitkAYDYRIbUQRQjWBwJRzChi9CRlBcY1UN4g0/VNB0AlcvcAYHRyZPdEQFYV8ccwR5HWxEJ02YmRMLnJ1xCYp0Y5idpQuhopmmC2KgojKasUQDk5BNAwwMOh2RtRq5uQuPZKGIJQIGwAwGf6I0JXMpC8C7kXWDBINFMxS4DKMAWVWAGYsAdNqW5uaRxkSKJOZKaU3tPOBZ4DuK2LATgJhkPJMgTwKCdFjyPHEnKxFCDhEAACH5BAkKAAAALAAAAAAgACAAAATzEMhJaVKp6s2nIkolIJ2WkBShpkVRWqqQrhLSEu9MZJKK9y1ZrqYK9WiClmvoUaF8gIQSNeF1Er4MNFn4SRSDARWroAIETg1iVwuHjYB1kYc1mwruwXKC9gmsJXliGxc+XiUCby9ydh1sOSdMkpMTBpaXBzsfhoc5l58Gm5yToAaZhaOUqjkDgCWNHAULCwOLaTmzswadEqggQwgHuQsHIoZCHQMMQgQGubVEcxOPFAcMDAYUA85eWARmfSRQCdcMe0zeP1AAygwLlJtPNAAL19DARdPzBOWSm1brJBi45soRAWQAAkrQIykShQ9wVhHCwCQCACH5BAkKAAAALAAAAAAgACAAAATrEMhJaVKp6s2nIkqFZF2VIBWhUsJaTokqUCoBq+E71SRQeyqUToLA7VxF0JDyIQh/MVVPMt1ECZlfcjZJ9mIKoaTl1MRIl5o4CUKXOwmyrCInCKqcWtvadL2SYhyASyNDJ0uIiRMDjI0Fd30/iI2UA5GSS5UDj2l6NoqgOgN4gksEBgYFf0FDqKgHnyZ9OX8HrgYHdHpcHQULXAS2qKpENRg7eAMLC7kTBaixUYFkKAzWAAnLC7FLVxLWDBLKCwaKTULgEwbLA4hJtOkSBNqITT3xEgfLpBtzE/jiuL04RGEBgwWhShRgQExHBAAh+QQJCgAAACwAAAAAIAAgAAAE7xDISWlSqerNpyJKhWRdlSAVoVLCWk6JKlAqAavhO9UkUHsqlE6CwO1cRdCQ8iEIfzFVTzLdRAmZX3I2SfZiCqGk5dTESJeaOAlClzsJsqwiJwiqnFrb2nS9kmIcgEsjQydLiIlHehhpejaIjzh9eomSjZR+ipslWIRLAgMDOR2DOqKogTB9pCUJBagDBXR6XB0EBkIIsaRsGGMMAxoDBgYHTKJiUYEGDAzHC9EACcUGkIgFzgwZ0QsSBcXHiQvOwgDdEwfFs0sDzt4S6BK4xYjkDOzn0unFeBzOBijIm1Dgmg5YFQwsCMjp1oJ8LyIAACH5BAkKAAAALAAAAAAgACAAAATwEMhJaVKp6s2nIkqFZF2VIBWhUsJaTokqUCoBq+E71SRQeyqUToLA7VxF0JDyIQh/MVVPMt1ECZlfcjZJ9mIKoaTl1MRIl5o4CUKXOwmyrCInCKqcWtvadL2SYhyASyNDJ0uIiUd6GGl6NoiPOH16iZKNlH6KmyWFOggHhEEvAwwMA0N9GBsEC6amhnVcEwavDAazGwIDaH1ipaYLBUTCGgQDA8NdHz0FpqgTBwsLqAbWAAnIA4FWKdMLGdYGEgraigbT0OITBcg5QwPT4xLrROZL6AuQAPUS7bxLpoWidY0JtxLHKhwwMJBTHgPKdEQAACH5BAkKAAAALAAAAAAgACAAAATrEMhJaVKp6s2nIkqFZF2VIBWhUsJaTokqUCoBq+E71SRQeyqUToLA7VxF0JDyIQh/MVVPMt1ECZlfcjZJ9mIKoaTl1MRIl5o4CUKXOwmyrCInCKqcWtvadL2SYhyASyNDJ0uIiUd6GAULDJCRiXo1CpGXDJOUjY+Yip9DhToJA4RBLwMLCwVDfRgbBAaqqoZ1XBMHswsHtxtFaH1iqaoGNgAIxRpbFAgfPQSqpbgGBqUD1wBXeCYp1AYZ19JJOYgH1KwA4UBvQwXUBxPqVD9L3sbp2BNk2xvvFPJd+MFCN6HAAIKgNggY0KtEBAAh+QQJCgAAACwAAAAAIAAgAAAE6BDISWlSqerNpyJKhWRdlSAVoVLCWk6JKlAqAavhO9UkUHsqlE6CwO1cRdCQ8iEIfzFVTzLdRAmZX3I2SfYIDMaAFdTESJeaEDAIMxYFqrOUaNW4E4ObYcCXaiBVEgULe0NJaxxtYksjh2NLkZISgDgJhHthkpU4mW6blRiYmZOlh4JWkDqILwUGBnE6TYEbCgevr0N1gH4At7gHiRpFaLNrrq8HNgAJA70AWxQIH1+vsYMDAzZQPC9VCNkDWUhGkuE5PxJNwiUK4UfLzOlD4WvzAHaoG9nxPi5d+jYUqfAhhykOFwJWiAAAIfkECQoAAAAsAAAAACAAIAAABPAQyElpUqnqzaciSoVkXVUMFaFSwlpOCcMYlErAavhOMnNLNo8KsZsMZItJEIDIFSkLGQoQTNhIsFehRww2CQLKF0tYGKYSg+ygsZIuNqJksKgbfgIGepNo2cIUB3V1B3IvNiBYNQaDSTtfhhx0CwVPI0UJe0+bm4g5VgcGoqOcnjmjqDSdnhgEoamcsZuXO1aWQy8KAwOAuTYYGwi7w5h+Kr0SJ8MFihpNbx+4Erq7BYBuzsdiH1jCAzoSfl0rVirNbRXlBBlLX+BP0XJLAPGzTkAuAOqb0WT5AH7OcdCm5B8TgRwSRKIHQtaLCwg1RAAAOwAAAAAAAAAAAA=="  # noqa: E501
+# Animated spinner small enough to be re-sent with every progress update
+THROBBER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 32 32">'
+    '<circle cx="16" cy="16" r="12" fill="none" stroke="#888" stroke-width="4"'
+    ' stroke-dasharray="56 20"><animateTransform attributeName="transform"'
+    ' type="rotate" from="0 16 16" to="360 16 16" dur="1s"'
+    ' repeatCount="indefinite"/></circle></svg>'
+)
+THROBBER = "data:image/svg+xml;base64," + base64.b64encode(
+    THROBBER_SVG.encode("utf-8")
+).decode("utf-8")
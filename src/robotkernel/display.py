@@ -2,6 +2,8 @@
 from io import StringIO
 from robotkernel.constants import THROBBER
 import re
+import threading
+import time
 
 
 try:
@@ -14,12 +16,18 @@ class ProgressUpdater(StringIO):
     """Wrapper designed to capture robot.api.logger.console and display it."""
 
     colors = re.compile(r"\[[0-?]+[^m]+m")
+    interval = 0.25  # seconds
 
     def __init__(self, kernel: DisplayKernel, display_id, stdout):
         self.kernel = kernel
         self.display_id = display_id
         self.stdout = stdout
         self.progress = {"dots": [], "test": "n/a", "keyword": "n/a", "message": None}
+        self.status_line = ""
+        self.last_update = 0.0
+        self.timer = None
+        self.finished = False
+        self.lock = threading.Lock()
         self.kernel.send_display_data(
             {
                 "text/html": f""
@@ -34,38 +42,72 @@ class ProgressUpdater(StringIO):
         super().__init__()
 
     def _update(self):
-        status_line = " | ".join(
-            str(s)
-            for s in [
-                self.progress["test"],
-                self.progress["keyword"],
-                self.progress["message"],
-            ]
-            if s
-        )
-        self.kernel.send_update_display_data(
-            {
-                "text/html": f""
-                f'<img src="{THROBBER}" '
-                f'style="float:left;height:1em;margin-top:0.15em"/>'
-                f'<pre style="'
-                f"white-space:nowrap;overflow:hidden;padding-left:1ex;"
-                f'">{status_line}</pre>'
-            },
-            display_id=self.display_id,
-        )
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            status_line = " | ".join(
+                str(s)
+                for s in [
+                    self.progress["test"],
+                    self.progress["keyword"],
+                    self.progress["message"],
+                ]
+                if s
+            )
+            if self.finished or status_line == self.status_line:
+                return
+            self.status_line = status_line
+            self.last_update = time.monotonic()
+            self.kernel.send_update_display_data(
+                {
+                    "text/html": f""
+                    f'<img src="{THROBBER}" '
+                    f'style="float:left;height:1em;margin-top:0.15em"/>'
+                    f'<pre style="'
+                    f"white-space:nowrap;overflow:hidden;padding-left:1ex;"
+                    f'">{status_line}</pre>'
+                },
+                display_id=self.display_id,
+            )
+
+    def _schedule(self):
+        delay = self.last_update + self.interval - time.monotonic()
+        if delay <= 0:
+            self._update()
+            return
+        with self.lock:
+            if self.timer is not None or self.finished:
+                return  # pending update will send the latest progress
+            try:
+                self.timer = threading.Timer(delay, self._update)
+                self.timer.daemon = True
+                self.timer.start()
+            except RuntimeError:  # no threads (e.g. on pyolite)
+                self.timer = None
 
     def update(self, data):
         if "test" in data:
             self.progress["test"] = data["test"]
             self.progress["message"] = None
+            self._update()
         elif "keyword" in data:
             self.progress["keyword"] = data["keyword"]
             self.progress["message"] = None
-        self._update()
+            self._schedule()
+        else:
+            self._update()
 
     def write(self, s):
         self.progress["message"] = s.strip()
-        self._update()
+        self._schedule()
         self.stdout.write(s)
         return super().write(s)
+
+    def finish(self):
+        """Cancel pending update to not overwrite the final result display."""
+        with self.lock:
+            self.finished = True
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
@@ -1,15 +1,46 @@
 # -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from ipykernel.comm import CommManager
 from ipykernel.kernelbase import Kernel
 from ipykernel.zmqshell import ZMQInteractiveShell
+from robotkernel.exceptions import ExecutionInProgress
 from traitlets import Any
 from traitlets import Instance
 from traitlets import Type
+import asyncio
+import contextvars
+import inspect
+import signal
+import threading
+
+# ipykernel >= 7 may dispatch shell messages while another one is handled
+HAS_CONCURRENT_DISPATCH = (
+    hasattr(Kernel, "shell_main")
+    and hasattr(Kernel, "_get_shell_context_var")
+    and "concurrent" in inspect.signature(Kernel.dispatch_shell).parameters
+)
+
+
+@contextmanager
+def interrupt_handler(interrupt=None):
+    """Call interrupt instead of raising KeyboardInterrupt on SIGINT."""
+    handler = None
+    if interrupt is not None and threading.current_thread() is threading.main_thread():
+        handler = signal.signal(signal.SIGINT, lambda signum, frame: interrupt())
+    try:
+        yield
+    finally:
+        if handler is not None:
+            signal.signal(signal.SIGINT, handler)
 
 
 class DisplayKernel(Kernel):
     """BaseKernel with interactive shell for display hooks."""
 
+    # Shell messages handled while a cell is run in the background
+    concurrent_msg_types = ("complete_request", "inspect_request")
+
     shell = Instance(
         "IPython.core.interactiveshell.InteractiveShellABC", allow_none=True
     )
@@ -37,6 +68,71 @@ class DisplayKernel(Kernel):
         for type_ in ["comm_open", "comm_msg", "comm_close"]:
             self.shell_handlers[type_] = getattr(self.comm_manager, type_)
 
+        self.background = None  # single worker thread for run_in_background
+        self.background_future = None  # the latest call in the worker thread
+        self.background_thread_id = None
+
+    async def shell_main(self, subshell_id, msg):
+        """Overridden from parent to handle completion and inspection requests
+        while a cell is run in the background."""
+        lock = getattr(self, "_main_asyncio_lock", None)
+        ident_var = getattr(self, "_shell_parent_ident", None)
+        if (
+            HAS_CONCURRENT_DISPATCH
+            and subshell_id is None
+            and ident_var is not None
+            and isinstance(lock, asyncio.Lock)
+            and lock.locked()
+        ):
+            try:
+                _, frames = self.session.feed_identities(msg, copy=False)
+                header = self.session.deserialize(frames, content=False, copy=False)
+                msg_type = header["header"].get("msg_type")
+            except Exception:
+                msg_type = None
+            if msg_type in self.concurrent_msg_types:
+                ident = self._get_shell_context_var(ident_var)
+                parent = self.get_parent("shell")
+                try:
+                    await asyncio.ensure_future(
+                        self.dispatch_shell(msg, subshell_id=None, concurrent=True)
+                    )
+                finally:
+                    self.set_parent(ident, parent, channel="shell")
+                return
+        await super().shell_main(subshell_id, msg)
+
+    def submit_to_background(self, func, *args):
+        """Return future for func called in the background worker thread."""
+        if self.background is None:
+            self.background = ThreadPoolExecutor(
+                1, thread_name_prefix="robotkernel", initializer=self._init_background
+            )
+        context = contextvars.copy_context()  # keeps the parent of the request
+        self.background_future = self.background.submit(context.run, func, *args)
+        return self.background_future
+
+    def _init_background(self):
+        self.background_thread_id = threading.get_ident()
+
+    @property
+    def background_busy(self):
+        return self.background_future is not None and not self.background_future.done()
+
+    async def run_in_background(self, func, *args, interrupt=None):
+        """Await func in the background worker thread (SIGINT calls interrupt)."""
+        future = asyncio.wrap_future(self.submit_to_background(func, *args))
+        with interrupt_handler(interrupt):
+            return await future
+
+    def call_in_background(self, func, *args, interrupt=None):
+        """Call func in the background worker thread unless it is already busy."""
+        if self.background_busy:
+            raise ExecutionInProgress()
+        future = self.submit_to_background(func, *args)
+        with interrupt_handler(interrupt):
+            return future.result()
+
     user_module = Any()
 
     def _user_module_changed(self, name, old, new):
@@ -61,6 +157,10 @@ class DisplayKernel(Kernel):
 
     def do_shutdown(self, restart):
         self.shell.exit_now = True
+        if self.background is not None:
+            self.background.shutdown(wait=False)
+            self.background = None
+            self.background_future = None
 
     def send_error(self, content=None):
         self.send_response(self.iopub_socket, "error", content)
@@ -57,6 +57,14 @@ class DisplayKernel:
         self.execution_count = 0
         self.shell.exit_now = True
 
+    def run_in_background(self, func, *args, interrupt=None):
+        """Return the result of func called at once, because there are no threads."""
+        return func(*args)
+
+    def call_in_background(self, func, *args, interrupt=None):
+        """Return the result of func called at once, because there are no threads."""
+        return func(*args)
+
     def send_display_data(self, data=None, metadata=None, display_id=None):
         if isinstance(data, str):
             self.shell.display_pub.publish(**{"data": {"text/plain": data}})
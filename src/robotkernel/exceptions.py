@@ -7,3 +7,10 @@ class BrokenOpenConnection(Exception):
     def __init__(self, connection):
         """Init with connection be closed."""
         self.connection = connection
+
+
+class ExecutionInProgress(RuntimeError):
+    """Robot Framework execution requested while another one is running."""
+
+    def __init__(self, message="Another execution is still in progress."):
+        super().__init__(message)
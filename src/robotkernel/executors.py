@@ -1,31 +1,43 @@
 # -*- coding: utf-8 -*-
 from collections import OrderedDict
+from functools import partial
 from io import BytesIO
 from io import StringIO
 from IPython.core.display import display
-from PIL import Image
+from IPython.core.display import HTML
 from robot.reporting import ResultWriter
 from robot.running.model import TestSuite
+from robot.running.signalhandler import STOP_SIGNAL_MONITOR
 from robotkernel.builders import build_suite
+from robotkernel.constants import REPORT_MODE
+from robotkernel.constants import SCREENSHOT_CACHE_SIZE
+from robotkernel.constants import SCREENSHOT_FORMAT
+from robotkernel.constants import SCREENSHOT_MAX_WIDTH
+from robotkernel.constants import SCREENSHOT_QUALITY
 from robotkernel.display import DisplayKernel
 from robotkernel.display import ProgressUpdater
+from robotkernel.exceptions import ExecutionInProgress
 from robotkernel.listeners import ReturnValueListener
 from robotkernel.listeners import RobotKeywordsIndexerListener
 from robotkernel.listeners import RobotVariablesListener
 from robotkernel.listeners import StatusEventListener
-from robotkernel.utils import data_uri
+from robotkernel.parallel import run_in_processes
 from robotkernel.utils import javascript_uri
 from robotkernel.utils import to_mime_and_metadata
+from robotkernel.workers import requires_kernel_process
 from tempfile import TemporaryDirectory
 from traceback import format_exc
 from typing import List
+from typing import Optional
 from typing import Tuple
 from urllib.parse import unquote
 import base64
 import binascii
-import ipywidgets
+import ctypes
+import hashlib
 import os
 import re
+import shutil
 import sys
 import types
 import uuid
@@ -83,7 +95,7 @@ def execute_ipywidget(
 {name}
     {name}  {'  '.join([values[a[1]] for a in arguments])}
 """
-    suite = build_suite(code, history)
+    suite = build_suite(code, history, cache=getattr(kernel, "robot_model_cache", None))
     suite.rpa = True
     try:
         with TemporaryDirectory() as path:
@@ -106,19 +118,35 @@ def inject_ipywidget(
     name: str,
     arguments: List[Tuple[str, str, str]],
 ):
+    import ipywidgets  # imported on demand for faster kernel startup
+
     def execute(**values):
-        execute_ipywidget(
-            kernel,
-            code,
-            history,
-            listeners,
-            silent,
-            display_id,
-            rpa,
-            name,
-            arguments,
-            values,
-        )
+        # Run in the same thread with cells, but never at the same time
+        try:
+            kernel.call_in_background(
+                execute_ipywidget,
+                kernel,
+                code,
+                history,
+                listeners,
+                silent,
+                display_id,
+                rpa,
+                name,
+                arguments,
+                values,
+                interrupt=lambda: stop_robot_suite(
+                    getattr(kernel, "background_thread_id", None)
+                ),
+            )
+        except (ExecutionInProgress, KeyboardInterrupt) as e:
+            kernel.send_error(
+                {
+                    "ename": e.__class__.__name__,
+                    "evalue": str(e) or "Execution forcefully stopped.",
+                    "traceback": [],
+                }
+            )
 
     widgets = []
     controls = OrderedDict()
@@ -198,10 +226,14 @@ def execute_robot(
     history: OrderedDict,
     listeners: list,
     silent: bool,
+    processes: int = 0,
+    worker=None,
 ):
     display_id = str(uuid.uuid4())
     try:
-        suite = build_suite(code, history)
+        suite = build_suite(
+            code, history, cache=getattr(kernel, "robot_model_cache", None)
+        )
     except Exception as e:
         if not silent:
             kernel.send_error(
@@ -218,21 +250,34 @@ def execute_robot(
             "traceback": list(format_exc().splitlines()),
         }
 
+    if worker is not None and (
+        not suite.tests
+        or (processes > 1 and len(suite.tests) > 1)
+        or requires_kernel_process(suite, listeners)
+    ):
+        worker = None
+
     for listener in listeners:
-        # Update keywords catalog
+        # Update keywords catalog (from the events of the worker for libraries)
         if isinstance(listener, RobotKeywordsIndexerListener):
             # noinspection PyProtectedMember
-            listener._import_from_suite_data(suite)
+            listener._import_from_suite_data(suite, libraries=worker is None)
         # Drop global variables from cache
         if isinstance(listener, RobotVariablesListener):
             for variable in suite.resource.variables:
                 listener.variables.pop(variable.name, None)
 
     if suite.tests:  # noqa: W0125
+        if processes > 1 and len(suite.tests) > 1:
+            run = partial(run_in_processes, code, history, processes)
+        elif worker is not None:
+            run = partial(worker.run, code, history)
+        else:
+            run = None
         try:
             with TemporaryDirectory() as path:
                 reply = run_robot_suite(
-                    kernel, suite, listeners, silent, display_id, path
+                    kernel, suite, listeners, silent, display_id, path, run=run
                 )
         except PermissionError:
             # Purging of TemporaryDirectory may fail e.g. with geckodriver.log still open
@@ -251,6 +296,17 @@ def execute_robot(
     return reply
 
 
+def stop_robot_suite(thread_id: Optional[int] = None):
+    """Stop running suite, forcefully on the second request."""
+    # noinspection PyProtectedMember
+    STOP_SIGNAL_MONITOR._signal_count += 1
+    # noinspection PyProtectedMember
+    if STOP_SIGNAL_MONITOR._signal_count > 1 and thread_id is not None:
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(thread_id), ctypes.py_object(KeyboardInterrupt)
+        )
+
+
 def run_robot_suite(
     kernel: DisplayKernel,
     suite: TestSuite,
@@ -259,6 +315,7 @@ def run_robot_suite(
     display_id: str,
     path: str,
     widget: bool = False,
+    run=None,
 ):
     return_values = []
     if not (silent or widget):
@@ -277,7 +334,7 @@ def run_robot_suite(
     if progress is not None:
         sys.__stdout__ = progress
     try:
-        results = suite.run(
+        results = (run or suite.run)(
             outputdir=path,
             stdout=stdout,
             listener=listeners,
@@ -286,6 +343,7 @@ def run_robot_suite(
     finally:
         if progress is not None:
             sys.__stdout__ = progress.stdout
+            progress.finish()
 
     stats = results.statistics
 
@@ -313,36 +371,28 @@ def run_robot_suite(
             kernel.send_execute_result(bundle, metadata)
 
     # Process screenshots
-    process_screenshots(kernel, path, silent)
-
-    # Generate report
-    writer = ResultWriter(os.path.join(path, "output.xml"))
-    writer.write_results(
-        log=os.path.join(path, "log.html"),
-        report=os.path.join(path, "report.html"),
-        rpa=getattr(suite, "rpa", False),
-        loglevel=LOGLEVEL,
+    process_screenshots(
+        kernel, path, silent, getattr(kernel, "robot_screenshot_cache", None)
     )
 
-    with open(os.path.join(path, "log.html"), "rb") as fp:
-        log = fp.read()
-        log = log.replace(b'"reportURL":"report.html"', b'"reportURL":null')
-
-    with open(os.path.join(path, "report.html"), "rb") as fp:
-        report = fp.read()
-        report = report.replace(b'"logURL":"log.html"', b'"logURL":null')
-
     # Clear status and display results
     if not silent:
-        (widget and kernel.send_display_data or kernel.send_update_display_data)(
-            {
+        rpa = getattr(suite, "rpa", False)
+        if REPORT_MODE == "on-demand":
+            bundle = get_on_demand_results_bundle(kernel, path, display_id, rpa)
+        elif kernel.robot_artifacts.linkable:
+            bundle = get_linked_results_bundle(kernel, path, display_id, rpa)
+        else:
+            write_results(path, rpa, ["log", "report"])
+            bundle = {
                 "text/html": ""  # noqa: C0209
                 '<p><a href="about:" onClick="{}">Log</a> | <a href="about:" onClick="{}">Report</a></p>'.format(
-                    javascript_uri(log, "log.html"),
-                    javascript_uri(report, "report.html"),
+                    javascript_uri(read_result(path, "log"), "log.html"),
+                    javascript_uri(read_result(path, "report"), "report.html"),
                 )
-            },
-            display_id=display_id,
+            }
+        (widget and kernel.send_display_data or kernel.send_update_display_data)(
+            bundle, display_id=display_id
         )
 
     # Reply ok on pass
@@ -361,50 +411,219 @@ def run_robot_suite(
         return {"status": "ok", "execution_count": kernel.execution_count}
 
 
-def process_screenshots(kernel: DisplayKernel, path: str, silent: bool):
-    cwd = os.getcwd()
-    with open(os.path.join(path, "output.xml"), encoding="utf-8") as fp:
-        xml = fp.read()
-    for src in re.findall('img src="([^"]+)', xml):
-        if os.path.exists(src):
-            filename = src
-        elif os.path.exists(os.path.join(path, src)):
-            filename = os.path.join(path, src)
-        elif os.path.exists(os.path.join(cwd, src)):
-            filename = os.path.join(cwd, src)
-        elif src.startswith("data:"):
-            filename = None
-            try:
-                spec, uri = src.split(",", 1)
-                spec, encoding = spec.split(";", 1)
-                spec, mimetype = spec.split(":", 1)
-                if not (encoding == "base64" and mimetype.startswith("image/")):
-                    continue
-                data = base64.b64decode(unquote(uri).encode("utf-8"))
-                im = Image.open(BytesIO(data))
-            except (binascii.Error, IndexError, ValueError):
-                continue
+def write_results(path: str, rpa: bool, names: List[str]):
+    """Write log.html and/or report.html from output.xml in path."""
+    writer = ResultWriter(os.path.join(path, "output.xml"))
+    writer.write_results(
+        log="log" in names and os.path.join(path, "log.html") or None,
+        report="report" in names and os.path.join(path, "report.html") or None,
+        rpa=rpa,
+        loglevel=LOGLEVEL,
+    )
+
+
+def read_result(path: str, name: str) -> bytes:
+    """Read log.html or report.html in path without links to each other."""
+    with open(os.path.join(path, f"{name}.html"), "rb") as fp:
+        data = fp.read()
+    if name == "log":
+        return data.replace(b'"reportURL":"report.html"', b'"reportURL":null')
+    else:
+        return data.replace(b'"logURL":"log.html"', b'"logURL":null')
+
+
+def get_linked_results_bundle(
+    kernel: DisplayKernel, path: str, display_id: str, rpa: bool
+) -> dict:
+    """Keep output.xml, log and report in artifact store and return links to them."""
+    store = kernel.robot_artifacts
+    dirname = store.add(display_id)
+    shutil.copy(os.path.join(path, "output.xml"), dirname)
+    write_results(dirname, rpa, ["log", "report"])
+    store.evict(keep=display_id)
+    return {
+        "text/html": f'<p><a href="{store.href(display_id, "log.html")}" '
+        f'target="_blank">Log</a> | '
+        f'<a href="{store.href(display_id, "report.html")}" '
+        f'target="_blank">Report</a></p>'
+    }
+
+
+def get_on_demand_results_bundle(
+    kernel: DisplayKernel, path: str, display_id: str, rpa: bool
+) -> dict:
+    """Keep output.xml and return widget bundle to generate log and report on click."""
+    import ipywidgets
+
+    store = kernel.robot_artifacts
+    dirname = store.add(display_id)
+    shutil.copy(os.path.join(path, "output.xml"), dirname)
+    store.evict(keep=display_id)
+    out = ipywidgets.widgets.Output()
+
+    def open_result(button):
+        name = button.description.lower()
+        filename = f"{name}.html"
+        if not os.path.exists(os.path.join(dirname, "output.xml")):
+            html = "<p>Result has already been removed.</p>"
+        elif store.linkable:
+            if not os.path.exists(os.path.join(dirname, filename)):
+                write_results(dirname, rpa, [name])
+                store.evict(keep=display_id)
+            html = (
+                f'<p><a href="{store.href(display_id, filename)}" '
+                f'target="_blank">Open {filename}</a></p>'
+            )
         else:
-            continue
-        if filename:
-            im = Image.open(filename)
-            mimetype = Image.MIME[im.format]
-            # Fix issue where Pillow on Windows returns APNG for PNG
-            if mimetype == "image/apng":
-                mimetype = "image/png"
+            if not os.path.exists(os.path.join(dirname, filename)):
+                write_results(dirname, rpa, [name])
+                store.evict(keep=display_id)
+            uri = javascript_uri(read_result(dirname, name), filename)
+            html = f'<p><a href="about:" onClick="{uri}">Open {filename}</a></p>'
+        with out:
+            out.clear_output(wait=True)
+            display(HTML(html))
+
+    buttons = []
+    for description in ["Log", "Report"]:
+        buttons.append(ipywidgets.widgets.Button(description=description))
+        buttons[-1].on_click(open_result)
+    ui = ipywidgets.widgets.VBox([ipywidgets.widgets.HBox(buttons), out])
+    return {
+        "text/plain": repr(ui),
+        "application/vnd.jupyter.widget-view+json": {
+            "version_major": 2,
+            "version_minor": 0,
+            "model_id": ui.model_id,
+        },
+    }
+
+
+# Image (e.g. screenshot) optionally directly wrapped with a link
+SCREENSHOT_REGEXP = re.compile(
+    r'(?:a href="([^"]+)"(&gt;&lt;|><))?img src="([^"]+)"( width="800px")?'
+)
+
+
+def read_screenshot(src: str, path: str, cwd: str) -> Optional[bytes]:
+    """Return image data for image src (filename or data-uri) or None."""
+    if src.startswith("data:"):
+        try:
+            spec, uri = src.split(",", 1)
+            spec, encoding = spec.split(";", 1)
+            spec, mimetype = spec.split(":", 1)
+            if not (encoding == "base64" and mimetype.startswith("image/")):
+                return None
+            return base64.b64decode(unquote(uri).encode("utf-8"))
+        except (binascii.Error, IndexError, ValueError):
+            return None
+    for filename in [src, os.path.join(path, src), os.path.join(cwd, src)]:
+        if os.path.isfile(filename):
             with open(filename, "rb") as fp:
-                data = fp.read()
-        uri = data_uri(mimetype, data)
-        xml = xml.replace(f'a href="{src}"', "a")
-        xml = xml.replace(
-            f'img src="{src}" width="800px"',
-            f'img src="{uri}" style="max-width:800px;"',
-        )  # noqa: E501
-        xml = xml.replace(f'img src="{src}"', f'img src="{uri}"')
-        if not silent:
+                return fp.read()
+    return None
+
+
+def encode_screenshot(data: bytes) -> Optional[Tuple[str, str, int, int]]:
+    """Return (mimetype, base64 data, width, height) for image data or None."""
+    from PIL import Image
+
+    try:
+        im = Image.open(BytesIO(data))
+        format_ = SCREENSHOT_FORMAT or im.format
+        resize = SCREENSHOT_MAX_WIDTH and im.width > SCREENSHOT_MAX_WIDTH
+        if resize or format_ != im.format:
+            if resize:
+                im.thumbnail((SCREENSHOT_MAX_WIDTH, im.height))
+            if format_ == "JPEG" and im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            buffer = BytesIO()
+            im.save(buffer, format_, quality=SCREENSHOT_QUALITY)
+            data = buffer.getvalue()
+        mimetype = Image.MIME[format_]
+    except (KeyError, OSError, ValueError):
+        return None
+    # Fix issue where Pillow on Windows returns APNG for PNG
+    if mimetype == "image/apng":
+        mimetype = "image/png"
+    return mimetype, base64.b64encode(data).decode("utf-8"), im.width, im.height
+
+
+def get_screenshot(data: bytes, cache: Optional[OrderedDict] = None):
+    """Return (digest, mimetype, base64 data, width, height) for image data."""
+    digest = hashlib.sha1(data).hexdigest()
+    if cache is not None and digest in cache:
+        cache.move_to_end(digest)
+        return cache[digest]
+    encoded = encode_screenshot(data)
+    screenshot = encoded and (digest,) + encoded
+    if cache is not None and screenshot:
+        cache[digest] = screenshot
+        while len(cache) > 1 and (
+            sum(len(value[2]) for value in cache.values()) > SCREENSHOT_CACHE_SIZE
+        ):
+            cache.popitem(last=False)
+    return screenshot
+
+
+def process_screenshots(
+    kernel: DisplayKernel,
+    path: str,
+    silent: bool,
+    cache: Optional[OrderedDict] = None,
+):
+    """Embed screenshots into output.xml and display them."""
+    cwd = os.getcwd()
+    cache = OrderedDict() if cache is None else cache
+    screenshots = {}  # (digest, mimetype, width, height) by src (or its hash)
+    displayed = set()
+
+    def embed(match):
+        href, separator, src, width = match.groups()
+        key = src
+        if src.startswith("data:"):
+            key = hashlib.sha1(src.encode("utf-8")).hexdigest()
+        screenshot = None
+        if key not in screenshots:
+            data = read_screenshot(src, path, cwd)
+            screenshot = data and get_screenshot(data, cache)
+            screenshots[key] = screenshot and screenshot[:2] + screenshot[3:]
+        if not screenshots[key]:
+            return match.group(0)
+        if screenshot is None:  # encoded data is kept only in the bounded cache
+            screenshot = cache.get(screenshots[key][0])
+            if screenshot is not None:
+                cache.move_to_end(screenshot[0])
+            else:
+                data = read_screenshot(src, path, cwd)
+                screenshot = data and get_screenshot(data, cache)
+            if not screenshot:
+                return match.group(0)
+        # Link to the embedded image itself is removed, any other link is kept
+        prefix = ""
+        if href is not None:
+            prefix = ("a" if href == src else f'a href="{href}"') + separator
+        digest, mimetype, data, im_width, im_height = screenshot
+        if not silent and digest not in displayed:
+            displayed.add(digest)
             kernel.send_display_data(
-                {mimetype: base64.b64encode(data).decode("utf-8")},
-                {mimetype: {"height": im.height, "width": im.width}},
+                {mimetype: data},
+                {mimetype: {"height": im_height, "width": im_width}},
+            )
+        if width:
+            return (
+                f'{prefix}img src="data:{mimetype};base64,{data}"'
+                ' style="max-width:800px;"'
             )
-    with open(os.path.join(path, "output.xml"), "w", encoding="utf-8") as fp:
-        fp.write(xml)
+        return f'{prefix}img src="data:{mimetype};base64,{data}"'
+
+    source = os.path.join(path, "output.xml")
+    target = os.path.join(path, "output.xml.tmp")
+    with open(source, encoding="utf-8") as input_, open(
+        target, "w", encoding="utf-8"
+    ) as output:
+        for line in input_:
+            if "img src=" in line:
+                line = SCREENSHOT_REGEXP.sub(embed, line)
+            output.write(line)
+    os.replace(target, source)
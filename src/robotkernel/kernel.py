@@ -1,14 +1,24 @@
 # -*- coding: utf-8 -*-
+from collections import Counter
 from collections import OrderedDict
+from robot.running.signalhandler import STOP_SIGNAL_MONITOR
 from robotkernel import __version__
+from robotkernel.artifacts import ArtifactStore
 from robotkernel.completion_finders import complete_libraries
+from robotkernel.constants import ARTIFACTS_DIR
+from robotkernel.constants import ARTIFACTS_MAX_SIZE
 from robotkernel.constants import CONTEXT_LIBRARIES
+from robotkernel.constants import EXECUTION_MODE
 from robotkernel.constants import HAS_NBIMPORTER
+from robotkernel.constants import MAX_COMPLETIONS
+from robotkernel.constants import SELECTOR_COMPLETION_TIMEOUT
 from robotkernel.constants import VARIABLE_REGEXP
 from robotkernel.display import DisplayKernel
 from robotkernel.exceptions import BrokenOpenConnection
+from robotkernel.exceptions import ExecutionInProgress
 from robotkernel.executors import execute_python
 from robotkernel.executors import execute_robot
+from robotkernel.executors import stop_robot_suite
 from robotkernel.listeners import AppiumConnectionsListener
 from robotkernel.listeners import JupyterConnectionsListener
 from robotkernel.listeners import RobotKeywordsIndexerListener
@@ -20,22 +30,29 @@ from robotkernel.monkeypatches import inject_libdoc_ipynb_support
 from robotkernel.monkeypatches import inject_robot_ipynb_support
 from robotkernel.selectors import clear_selector_highlights
 from robotkernel.selectors import get_autoit_selector_completions
-from robotkernel.selectors import get_selector_completions
 from robotkernel.selectors import get_white_selector_completions
 from robotkernel.selectors import is_autoit_selector
 from robotkernel.selectors import is_selector
 from robotkernel.selectors import is_white_selector
+from robotkernel.selectors import SelectorCompleter
 from robotkernel.utils import close_current_connection
 from robotkernel.utils import detect_robot_context
-from robotkernel.utils import get_keyword_doc
+from robotkernel.utils import get_cached_keyword_doc
 from robotkernel.utils import get_lunr_completions
-from robotkernel.utils import lunr_builder
-from robotkernel.utils import lunr_query
+from robotkernel.utils import KeywordNames
+from robotkernel.utils import LunrIndex
 from robotkernel.utils import scored_results
 from robotkernel.utils import yield_current_connection
+from robotkernel.workers import RobotWorker
+from robotkernel.workers import WorkerError
+from weakref import WeakKeyDictionary
+import bisect
+import heapq
+import os
 import re
 import robot
 import sys
+import threading
 import uuid
 
 
@@ -73,40 +90,90 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
         # History to repeat after kernel restart
         self.robot_history = OrderedDict()
         self.robot_cell_id = None  # current cell id from init_metadata
-        self.robot_inspect_data = {}
-        self.robot_variables = []
+        self.robot_model_cache = {}  # parsed history models by cell id
+        self.robot_cell_variables = {}  # variable names by cell id
+        self.robot_variables = Counter()  # variable names by number of cells
+        self.robot_variable_names = []  # sorted variable names of all cells
+        self.robot_buffer_variables = {}  # variable names by completed line
         self.robot_suite_variables = {}
 
+        # Kept execution results (e.g. output.xml for on-demand reports)
+        self.robot_artifacts = ArtifactStore(
+            ARTIFACTS_DIR, ARTIFACTS_MAX_SIZE * 1024 * 1024
+        )
+
+        # Encoded screenshots by content hash
+        self.robot_screenshot_cache = OrderedDict()
+
         # Sticky connection cache (e.g. for webdrivers)
         self.robot_connections = []
         self.robot_libraries = {}
+        self.robot_selector_snapshots = WeakKeyDictionary()  # page states by driver
+        self.robot_selector_completer = SelectorCompleter(SELECTOR_COMPLETION_TIMEOUT)
+
+        # Identity of the thread running the current robot cell
+        self.robot_thread_id = None
+
+        # Warm worker process for robot cells, started in advance
+        self.robot_worker = None
+        if EXECUTION_MODE == "process":
+            self.robot_worker = RobotWorker()
 
         # Searchable index for keyword autocomplete documentation
-        builder = lunr_builder("dottedname", ["dottedname", "name"])
         self.robot_catalog = {
-            "builder": builder,
-            "index": None,
+            "index": LunrIndex("dottedname", ["dottedname", "name"]),
+            "names": KeywordNames(),
             "libraries": [],
             "keywords": {},
+            "lock": threading.RLock(),  # serializes updates from many threads
         }
-        populator = RobotKeywordsIndexerListener(self.robot_catalog)
-        populator.library_import("BuiltIn", {})
-        for name, keywords in CONTEXT_LIBRARIES.items():
-            # noinspection PyProtectedMember
-            populator._library_import(keywords, name)
+        self.robot_completion_cache = OrderedDict()  # recent keyword searches
+        self.robot_keyword_docs = OrderedDict()  # rendered documentation by ref
+        self.robot_catalog_ready = threading.Event()
+        self.robot_catalog_lock = threading.Lock()
+
+        # Populate BuiltIn and context keywords without blocking the startup
+        try:
+            threading.Thread(target=self.populate_robot_catalog, daemon=True).start()
+        except RuntimeError:
+            pass  # no threads (e.g. on pyolite): populate on first request
+
+    def populate_robot_catalog(self):
+        """Index BuiltIn and context keywords unless that is already done."""
+        with self.robot_catalog_lock:
+            if self.robot_catalog_ready.is_set():
+                return
+            populator = RobotKeywordsIndexerListener(self.robot_catalog)
+            populator.library_import("BuiltIn", {})
+            for name, keywords in CONTEXT_LIBRARIES.items():
+                # noinspection PyProtectedMember
+                populator._library_import(keywords, name)
+            self.robot_catalog_ready.set()
 
     def do_shutdown(self, restart):
         super().do_shutdown(restart)
         self.robot_history = OrderedDict()
-        self.robot_variables = []
+        self.robot_model_cache = {}
+        self.robot_cell_variables = {}
+        self.robot_variables = Counter()
+        self.robot_variable_names = []
+        self.robot_buffer_variables = {}
         self.robot_suite_variables = {}
+        self.robot_selector_completer.shutdown()
         for driver in self.robot_connections:
             if hasattr(driver["instance"], "quit"):
                 driver["instance"].quit()
         self.robot_connections = []
         self.robot_libraries = {}
+        self.robot_selector_snapshots = WeakKeyDictionary()
+        self.robot_selector_completer = SelectorCompleter(SELECTOR_COMPLETION_TIMEOUT)
+        self.robot_artifacts.cleanup()
+        if self.robot_worker is not None:
+            self.robot_worker.close()
+            self.robot_worker = None
 
     def do_complete(self, code, cursor_pos):
+        self.populate_robot_catalog()
         context = detect_robot_context(code, cursor_pos)
         cursor_pos = cursor_pos is None and len(code) or cursor_pos
         line, offset = line_at_cursor(code, cursor_pos)
@@ -114,16 +181,20 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
         needle = re.split(r"\s{2,}|\t| \| ", line[:line_cursor])[-1].lstrip()
 
         if needle and needle[0] in "$@&%":  # is variable completion
+            lower = needle.lower()
+            variables = heapq.merge(
+                (v for v in self.robot_variable_names if lower in v.lower()),
+                sorted(
+                    v
+                    for v in self.get_robot_buffer_variables(code)
+                    if v not in self.robot_variables and lower in v.lower()
+                ),
+            )
             matches = [
                 m["ref"]
                 for m in scored_results(
-                    needle,
-                    [
-                        dict(ref=v)
-                        for v in (self.robot_variables + VARIABLE_REGEXP.findall(code))
-                    ],
+                    needle, [dict(ref=v) for v in variables], MAX_COMPLETIONS
                 )
-                if needle.lower() in m["ref"].lower()
             ]
             if len(line) > line_cursor and line[line_cursor] == "}":
                 cursor_pos += 1
@@ -133,7 +204,9 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
             for driver in yield_current_connection(
                 self.robot_connections, ["selenium", "jupyter", "appium"]
             ):
-                matches = get_selector_completions(needle.rstrip(), driver)
+                matches = self.robot_selector_completer.complete(
+                    needle.rstrip(), driver, self.robot_selector_snapshots
+                )
         elif is_autoit_selector(needle):
             matches = get_autoit_selector_completions(needle)
         elif is_white_selector(needle):
@@ -148,19 +221,10 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
         ):
             matches = complete_libraries(needle.lower())
         else:
-            # Clear selector completion highlights
-            for driver in yield_current_connection(
-                self.robot_connections, ["selenium", "jupyter"]
-            ):
-                try:
-                    clear_selector_highlights(driver)
-                except BrokenOpenConnection:
-                    close_current_connection(self.robot_connections, driver)
+            # Clear selector completion highlights (unless drivers are busy)
+            self.clear_robot_selector_highlights(0)
             matches = get_lunr_completions(
-                needle,
-                self.robot_catalog["index"],
-                self.robot_catalog["keywords"],
-                context,
+                needle, self.robot_catalog, context, self.robot_completion_cache
             )
 
         return {
@@ -172,6 +236,7 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
         }
 
     def do_inspect(self, code, cursor_pos, detail_level=0, _=None):
+        self.populate_robot_catalog()
         cursor_pos = cursor_pos is None and len(code) or cursor_pos
         line, offset = line_at_cursor(code, cursor_pos)
         line_cursor = cursor_pos - offset
@@ -179,27 +244,46 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
         right_needle = re.split(r"\s{2,}|\t| \| ", line[line_cursor:])[0]
         needle = left_needle.lstrip().lower() + right_needle.rstrip().lower()
 
-        reply_content = {
+        data = {}
+        ref = self.robot_catalog["names"].find(needle)
+        keyword = self.robot_catalog["keywords"].get(ref)
+        if keyword is not None:
+            data.update(get_cached_keyword_doc(ref, keyword, self.robot_keyword_docs))
+
+        return {
             "status": "ok",
-            "data": self.robot_inspect_data,
+            "data": data,
             "metadata": {},
-            "found": bool(self.robot_inspect_data),
+            "found": bool(data),
         }
 
-        results = []
-        if needle and lunr_query(needle):
-            query = lunr_query(needle)
-            results = self.robot_catalog["index"].search(query)
-            results += self.robot_catalog["index"].search(query.strip("*"))
-        for result in results:
-            keyword = self.robot_catalog["keywords"][result["ref"]]
-            if needle not in [keyword.name.lower(), result["ref"].lower()]:
-                continue
-            self.robot_inspect_data.update(get_keyword_doc(keyword))
-            reply_content["found"] = True
-            break
-
-        return reply_content
+    def get_robot_buffer_variables(self, code):
+        """Return variable names of code, scanning only lines changed since last."""
+        previous = self.robot_buffer_variables
+        self.robot_buffer_variables = current = {}
+        for line in code.splitlines():
+            if line not in current:
+                current[line] = previous.get(line)
+                if current[line] is None:
+                    current[line] = VARIABLE_REGEXP.findall(line)
+        return set().union(*current.values())
+
+    def update_robot_variables(self, cell_id, code):
+        """Update variable names of the cell (or remove them when code is None)."""
+        names = code and set(VARIABLE_REGEXP.findall(code)) or set()
+        previous = self.robot_cell_variables.pop(cell_id, set())
+        for name in previous - names:
+            self.robot_variables[name] -= 1
+            if self.robot_variables[name] <= 0:
+                del self.robot_variables[name]
+                idx = bisect.bisect_left(self.robot_variable_names, name)
+                del self.robot_variable_names[idx]
+        for name in names - previous:
+            self.robot_variables[name] += 1
+            if self.robot_variables[name] == 1:
+                bisect.insort(self.robot_variable_names, name)
+        if names:
+            self.robot_cell_variables[cell_id] = names
 
     def init_metadata(self, parent):
         # Jupyter Lab sends deleted cells and the currently updated cell
@@ -209,6 +293,8 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
         for cell_id in deleted_cells:
             if cell_id in self.robot_history:
                 del self.robot_history[cell_id]
+            self.robot_model_cache.pop(cell_id, None)
+            self.update_robot_variables(cell_id, None)
         self.robot_cell_id = (parent.get("metadata") or {}).get("cellId") or None
         return super().init_metadata(parent)
 
@@ -222,19 +308,17 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
                     del sys.modules[name]
 
         # Clear selector completion highlights
-        for driver in yield_current_connection(
-            self.robot_connections, ["selenium", "jupyter"]
-        ):
-            try:
-                clear_selector_highlights(driver)
-            except BrokenOpenConnection:
-                close_current_connection(self.robot_connections, driver)
+        self.clear_robot_selector_highlights(SELECTOR_COMPLETION_TIMEOUT)
 
         # Support %sticky library LibraryMagic cell magic
         match = re.findall(r"^%sticky library ([a-zA-Z_]+)", code, flags=re.MULTILINE)
         for name in match:
             self.robot_libraries.setdefault(name, None)
 
+        # Support %parallel [processes] cell magic
+        match = re.search(r"^%parallel(?: ([0-9]+))?$", code, flags=re.MULTILINE)
+        processes = match and int(match.group(1) or os.cpu_count() or 1) or 0
+
         # Support %%python module ModuleName cell magic
         match = re.match("^%%python module ([a-zA-Z_]+)", code)
         if match is not None:
@@ -246,14 +330,6 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
                 silent,
             )
         else:
-            # Update variables
-            self.robot_variables = []
-            for historical in self.robot_history.values():
-                self.robot_variables.extend(
-                    VARIABLE_REGEXP.findall(historical, re.U & re.M)
-                )
-            self.robot_variables.extend(VARIABLE_REGEXP.findall(code, re.U & re.M))
-
             # Configure listeners
             listeners = [
                 SeleniumConnectionsListener(self.robot_connections),
@@ -265,20 +341,102 @@ class RobotKernel(DisplayKernel):  # noqa: R0901 Too many ancestors
                 StickyLibraryListener(self.robot_libraries),
             ]
 
-            # Execute test case
-            result = execute_robot(
-                self,
+            # Execute test case in background to keep completion responsive
+            return self.run_in_background(
+                self.execute_robot_cell,
                 code,
-                self.robot_history,
+                self.robot_cell_id,
                 listeners,
                 silent,
+                processes,
+                interrupt=lambda: stop_robot_suite(self.robot_thread_id),
             )
 
-            # Save history
-            if result["status"] == "ok":
-                self.robot_history[self.robot_cell_id or str(uuid.uuid4())] = code
+    def clear_robot_selector_highlights(self, timeout):
+        """Clear selector completion highlights unless the drivers are still
+        used by a completion (or a cell) after timeout."""
+        with self.robot_selector_completer.idle(timeout) as idle:
+            if not idle:
+                return
+            for driver in yield_current_connection(
+                self.robot_connections, ["selenium", "jupyter"]
+            ):
+                try:
+                    clear_selector_highlights(driver, self.robot_selector_snapshots)
+                except BrokenOpenConnection:
+                    close_current_connection(self.robot_connections, driver)
+
+    def get_robot_worker(self):
+        """Return worker process for the cell or None to run it in-process."""
+        if EXECUTION_MODE != "process" or self.robot_libraries:
+            return None  # sticky libraries must remain in the kernel process
+        if self.robot_worker is None or not self.robot_worker.alive:
+            self.robot_worker = RobotWorker()
+        return self.robot_worker
+
+    def execute_robot_cell(self, code, cell_id, listeners, silent, processes=0):
+        self.robot_thread_id = threading.get_ident()
+        try:
+            # Drivers are not used for selector completion during the execution
+            with self.robot_selector_completer.idle(
+                SELECTOR_COMPLETION_TIMEOUT
+            ) as idle:
+                if not idle:
+                    raise ExecutionInProgress(
+                        "Selector completion is still using the browser "
+                        "(e.g. waiting for an element to be picked). "
+                        "Please, try again."
+                    )
+                result = execute_robot(
+                    self,
+                    code,
+                    self.robot_history,
+                    listeners,
+                    silent,
+                    processes,
+                    self.get_robot_worker(),
+                )
+        except KeyboardInterrupt:
+            error = {
+                "ename": "KeyboardInterrupt",
+                "evalue": "Execution forcefully stopped.",
+                "traceback": [],
+            }
+            if not silent:
+                self.send_error(error)
+            return dict(status="error", **error)
+        except ExecutionInProgress as e:
+            error = {
+                "ename": e.__class__.__name__,
+                "evalue": str(e),
+                "traceback": [],
+            }
+            if not silent:
+                self.send_error(error)
+            return dict(status="error", **error)
+        except WorkerError as e:
+            error = {
+                "ename": e.__class__.__name__,
+                "evalue": str(e).strip().splitlines()[-1],
+                "traceback": str(e).splitlines(),
+            }
+            if not silent:
+                self.send_error(error)
+            return dict(status="error", **error)
+        finally:
+            self.robot_thread_id = None
+            if self.robot_worker is not None and not self.robot_worker.alive:
+                self.robot_worker = RobotWorker()  # replace crashed worker
+            # noinspection PyProtectedMember
+            STOP_SIGNAL_MONITOR._signal_count = 0  # ignore late stop requests
+
+        # Save history
+        if result["status"] == "ok":
+            cell_id = cell_id or str(uuid.uuid4())
+            self.robot_history[cell_id] = code
+            self.update_robot_variables(cell_id, code)
 
-            return result
+        return result
 
 
 if __name__ == "__main__":
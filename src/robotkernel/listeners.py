@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
 from robot.errors import DataError
 from robot.libdocpkg import LibraryDocumentation
+from robot.libraries import STDLIBS
 from robot.libraries.BuiltIn import BuiltIn
+from robotkernel.constants import LIBDOC_CACHE_DIR
+import hashlib
+import importlib.machinery
+import importlib.util
 import inspect
+import os
+import re
+import robot
+import tempfile
+import threading
 
 
 BUILTIN_VARIABLES = (
@@ -28,6 +38,100 @@ BUILTIN_VARIABLES = (
 )
 
 
+def get_library_source(name):
+    """Return path to the source of the named library without importing it."""
+    if os.path.exists(name):
+        return name
+    if name in STDLIBS:
+        name = f"robot.libraries.{name}"
+    # Look up submodules from the package paths, because find_spec with dotted
+    # name would import the parent packages
+    spec = None
+    for part in name.split("."):
+        try:
+            if spec is None:
+                found = importlib.util.find_spec(part)
+            else:
+                path = spec.submodule_search_locations
+                found = importlib.machinery.PathFinder.find_spec(part, path)
+        except (ImportError, ValueError):
+            found = None
+        if found is None:
+            break  # e.g. class of the module
+        spec = found
+        if spec.submodule_search_locations is None:
+            break
+    return getattr(spec, "origin", None)
+
+
+def get_source_mtime(source):
+    """Return latest modification time of the library module or package."""
+    if not os.path.basename(source).startswith("__init__."):
+        return os.path.getmtime(source)
+    mtime = 0
+    for root, dirs, files in os.walk(os.path.dirname(source)):
+        # Skip non-package directories (e.g. node_modules of Browser library)
+        dirs[:] = [
+            dirname
+            for dirname in dirs
+            if os.path.isfile(os.path.join(root, dirname, "__init__.py"))
+        ]
+        files = [name for name in files if name.endswith(".py")]
+        for path in [root] + [os.path.join(root, name) for name in files]:
+            try:
+                mtime = max(mtime, os.path.getmtime(path))
+            except OSError:
+                pass
+    return mtime
+
+
+def get_libdoc_cache_path(name, source=None):
+    """Return libdoc cache path for the named library or None if not cacheable."""
+    source = source or get_library_source(name)
+    if not LIBDOC_CACHE_DIR or not source or not os.path.isfile(source):
+        return None
+    key = f"{name}:{robot.__version__}:{source}:{get_source_mtime(source)}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    filename = re.sub(r"[^\w.-]", "_", name)[-64:] + f"-{digest}.json"
+    return os.path.join(os.path.expanduser(LIBDOC_CACHE_DIR), filename)
+
+
+def get_library_documentation(name, source=None, spec=None):
+    """Return LibraryDocumentation for the named library using persistent cache
+    or the given JSON spec (e.g. documented in the worker process)."""
+    path = get_libdoc_cache_path(name, source)
+    if path is not None and os.path.exists(path):
+        try:
+            return LibraryDocumentation(path)
+        except DataError:
+            pass
+    if spec is not None:
+        fd, tmp = tempfile.mkstemp(suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                fp.write(spec)
+            lib_doc = LibraryDocumentation(tmp)
+        finally:
+            os.remove(tmp)
+    else:
+        lib_doc = LibraryDocumentation(name)
+    if path is not None and hasattr(lib_doc, "to_json"):  # RF >= 4.0
+        # Write atomically, because the cache may be shared by many kernels
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                    fp.write(lib_doc.to_json())
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        except OSError:
+            pass
+    return lib_doc
+
+
 class RobotVariablesListener:
     ROBOT_LISTENER_API_VERSION = 2
 
@@ -67,14 +171,21 @@ class RobotKeywordsIndexerListener:
 
     def __init__(self, catalog):
         self.catalog = catalog
+        # Catalog is updated from both the startup indexing and the execution
+        # threads, and its segments are replaced by copying the others
+        self.lock = catalog.setdefault("lock", threading.RLock())
 
     # noinspection PyUnusedLocal
     def library_import(self, alias, attributes):
         name = attributes.get("originalName") or alias
-        if alias not in self.catalog["libraries"]:
+        with self.lock:
+            if alias in self.catalog["libraries"]:
+                return
             self.catalog["libraries"].append(alias)
             try:
-                lib_doc = LibraryDocumentation(name)
+                lib_doc = get_library_documentation(
+                    name, attributes.get("source"), attributes.get("libdoc")
+                )
                 self._library_import(lib_doc, alias)
             except DataError:
                 pass
@@ -89,47 +200,60 @@ class RobotKeywordsIndexerListener:
                 doc_format = lib_doc.doc_format
             except AttributeError:
                 doc_format = "REST"
+        documents = []
         for keyword in keywords:
             try:
                 keyword.doc_format = doc_format
             except AttributeError:
                 pass
-            self.catalog["builder"].add(
+            documents.append(
                 {"name": keyword.name, "dottedname": f"{alias}.{keyword.name}"}
             )
             self.catalog["keywords"][f"{alias}.{keyword.name}"] = keyword
-        if len(self.catalog["keywords"]):
-            self.catalog["index"] = self.catalog["builder"].build()
+        self._update_catalog(alias, documents)
 
     # noinspection PyUnusedLocal
     def resource_import(self, name, attributes):
-        if name not in self.catalog["libraries"]:
+        with self.lock:
+            if name in self.catalog["libraries"]:
+                return
             self.catalog["libraries"].append(name)
             try:
                 resource_doc = LibraryDocumentation(name)
-                self._resource_import(resource_doc.keywords)
+                self._resource_import(resource_doc.keywords, name)
             except DataError:
                 pass
 
-    def _resource_import(self, keywords):
+    def _resource_import(self, keywords, name="__suite__"):
+        documents = []
         for keyword in keywords:
             try:
                 keyword.doc_format = "REST"
             except AttributeError:
                 pass
-            self.catalog["builder"].add(
-                {"name": keyword.name, "dottedname": keyword.name}
-            )
+            documents.append({"name": keyword.name, "dottedname": keyword.name})
             self.catalog["keywords"][keyword.name] = keyword
-        if len(self.catalog["keywords"]):
-            self.catalog["index"] = self.catalog["builder"].build()
+        self._update_catalog(name, documents)
+
+    def _update_catalog(self, name, documents):
+        # Names are updated first, because the index version tells completion
+        # when its cached results are stale
+        with self.lock:
+            self.catalog["names"].update(
+                name, [(d["dottedname"], d["name"]) for d in documents]
+            )
+            self.catalog["index"].update(name, documents)
 
-    def _import_from_suite_data(self, suite):
+    def _import_from_suite_data(self, suite, libraries=True):
+        # Suite keywords replace their previous segment, which is rebuilt only
+        # when the set of keyword names has changed
         self._resource_import(suite.resource.keywords)
         try:
             for import_data in suite.resource.imports:
                 attributes = {}
-                if import_data.type == "Library":
+                if import_data.type.upper() == "LIBRARY":  # "LIBRARY" on RF >= 7
+                    if not libraries:
+                        continue
                     alias = import_data.alias or import_data.name
                     attributes["originalName"] = import_data.name
                     self.library_import(alias, attributes)
@@ -150,19 +274,31 @@ class StatusEventListener:
     def start_test(self, name, attributes):
         self.callback({"test": name})
 
+    def end_test(self, name, attributes):
+        self.callback({})  # flush the latest progress
+
     def start_keyword(self, name, attributes):
         self.callback({"keyword": name})
 
 
 # noinspection PyUnusedLocal
 class ReturnValueListener:
+    """Capture the return value of the last top-level keyword of each test."""
+
     ROBOT_LISTENER_API_VERSION = 2
 
     def __init__(self, callback):
         self.callback = callback
         self.return_value = None
+        self.depth = 0
+
+    def start_keyword(self, name, attributes):
+        self.depth += 1
 
     def end_keyword(self, name, attributes):
+        self.depth -= 1
+        if self.depth > 0:
+            return
         if "capture" in name.lower() and "screenshot" in name.lower():
             # Intentional hack to not include screenshot keywords, because we
             # can assume their screenshots be embedded into log file and
@@ -170,13 +306,16 @@ class ReturnValueListener:
             return
         frame = inspect.currentframe()
         while frame is not None:
-            if "return_value" in frame.f_locals:
-                self.return_value = frame.f_locals.get("return_value")
-                break
+            code = frame.f_code
+            if "return_value" in code.co_varnames or "return_value" in code.co_cellvars:
+                if "return_value" in frame.f_locals:
+                    self.return_value = frame.f_locals.get("return_value")
+                    break
             frame = frame.f_back
 
     def start_test(self, name, attributes):
         self.return_value = None
+        self.depth = 0
 
     def end_test(self, name, attributes):
         self.callback(self.return_value)
@@ -46,9 +46,9 @@ def NotebookReader():  # noqa: N802
                 if not cell.cell_type == "code":
                     continue
 
-                # Clear %sticky library LibraryName cell magic
+                # Clear %sticky library LibraryName and %parallel cell magics
                 cell.source = re.sub(
-                    r"^%sticky library ([a-zA-Z_]+)",
+                    r"^%sticky library ([a-zA-Z_]+)|^%parallel( [0-9]+)?$",
                     "",
                     cell.source,
                     flags=re.MULTILINE,
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from io import StringIO
+from robot.api import ExecutionResult
+from robot.api import ResultVisitor
+from robot.output import LOGGER
+from robot.result import Result
+from robot.result import TestCase
+from robot.result import TestSuite
+from robot.running.signalhandler import STOP_SIGNAL_MONITOR
+from robotkernel.builders import build_suite
+from robotkernel.listeners import RobotVariablesListener
+from robotkernel.listeners import StatusEventListener
+from robotkernel.monkeypatches import inject_robot_ipynb_support
+from typing import Dict
+from typing import List
+from typing import Union
+import multiprocessing
+import os
+import pickle
+import re
+import signal
+
+# Relative links (e.g. to screenshots) in HTML log messages
+LINK_REGEXP = re.compile(r'((?:src|href)=")(?![\w+.-]+:|[/#])')
+
+
+class LinkPrefixer(ResultVisitor):
+    """Prefix relative links in HTML messages with the given directory."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def visit_message(self, msg):
+        if msg.html:
+            msg.message = LINK_REGEXP.sub(rf"\1{self.prefix}/", msg.message)
+
+
+def get_picklable(variables: dict) -> dict:
+    """Return the variables which can be passed to other processes."""
+    picklable = {}
+    for name, value in variables.items():
+        try:
+            pickle.dumps(value)
+        except Exception:  # noqa: B902
+            continue
+        picklable[name] = value
+    return picklable
+
+
+def init_process():
+    """Ignore interrupts in pool processes, except while running a test.
+
+    Otherwise an interrupt would kill the idle processes and break the pool.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    inject_robot_ipynb_support()
+
+
+def run_test(
+    code: str,
+    history: Dict[str, str],
+    index: int,
+    variables: dict,
+    outputdir: str,
+    loglevel: str,
+):
+    """Run the test at index of the suite built from code and history.
+
+    Every test writes its output.xml and other files (e.g. screenshots) into
+    its own subdirectory of outputdir. Return the path to output.xml with the
+    console output and the variables at the end of the run.
+    """
+    suite = build_suite(code, history)
+    suite.tests = [suite.tests[index]]
+    stdout = StringIO()
+    listener = RobotVariablesListener(variables)
+    path = os.path.join(outputdir, f"test-{index}")
+    handler = signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        suite.run(
+            outputdir=path,
+            log=None,
+            report=None,
+            stdout=stdout,
+            listener=[listener],
+            loglevel=loglevel,
+        )
+    finally:
+        signal.signal(signal.SIGINT, handler)
+    return (
+        os.path.join(path, "output.xml"),
+        stdout.getvalue(),
+        get_picklable(listener.variables),
+    )
+
+
+def merge_outputs(outputs: List[Union[str, TestCase]], path: str, name: str = ""):
+    """Merge outputs of the same suite with different tests into path.
+
+    Like rebot, but tests are combined into the same suite instead of
+    combining the suites under a new top-level suite. Tests without output
+    (e.g. when their process crashed) are given as result test cases.
+    """
+    result = None
+    tests = []
+    for output in outputs:
+        if isinstance(output, TestCase):
+            tests.append(output)
+            continue
+        other = ExecutionResult(output)
+        other.visit(LinkPrefixer(os.path.basename(os.path.dirname(output))))
+        tests.extend(other.suite.tests)
+        if result is None:
+            result = other
+        else:
+            result.errors.messages.extend(other.errors.messages)
+    if result is None:
+        result = Result(suite=TestSuite(name=name))
+    result.suite.tests = tests
+    result.save(path)
+    return result
+
+
+def run_in_processes(
+    code: str,
+    history: Dict[str, str],
+    processes: int,
+    outputdir: str,
+    stdout,
+    listener: list,
+    loglevel: str,
+):
+    """Run the tests of the suite built from code and history in processes.
+
+    Signature is compatible with TestSuite.run as called by run_robot_suite.
+    Variables of RobotVariablesListener are passed to and from the processes.
+    Other listeners are not called, except StatusEventListener for progress.
+    Stop request (e.g. interrupt) cancels the tests not yet started.
+    """
+    variables = {}
+    for candidate in listener:
+        if isinstance(candidate, RobotVariablesListener):
+            variables = candidate.variables
+    suite = build_suite(code, history)
+    tests = len(suite.tests)
+    picklable = get_picklable(variables)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        processes, mp_context=context, initializer=init_process
+    ) as pool:
+        futures = {
+            pool.submit(
+                run_test,
+                code,
+                history,
+                index,
+                picklable,
+                outputdir,
+                loglevel,
+            ): index
+            for index in range(tests)
+        }
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, 0.25, FIRST_COMPLETED)
+                # noinspection PyProtectedMember
+                if STOP_SIGNAL_MONITOR._signal_count:
+                    for future in pending:
+                        future.cancel()
+                for candidate in listener:
+                    if isinstance(candidate, StatusEventListener) and done:
+                        candidate.start_test(
+                            f"{tests - len(pending)}/{tests} tests", {}
+                        )
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    results = {}
+    for future, index in futures.items():
+        if future.cancelled():
+            continue
+        error = future.exception()  # e.g. BrokenProcessPool
+        if error is None:
+            results[index] = future.result()
+        else:
+            results[index] = TestCase(
+                name=suite.tests[index].name,
+                status="FAIL",
+                message=f"{error.__class__.__name__}: {error}",
+            )
+    # Like after TestSuite.run, results are written without console output
+    LOGGER.unregister_console_logger()
+    outputs = []
+    for index in sorted(results):
+        if isinstance(results[index], TestCase):
+            outputs.append(results[index])
+            stdout.write(f"{results[index].name} | FAIL |\n{results[index].message}\n")
+            continue
+        output, console, test_variables = results[index]
+        outputs.append(output)
+        stdout.write(console)
+        variables.update(test_variables)
+    return merge_outputs(outputs, os.path.join(outputdir, "output.xml"), suite.name)
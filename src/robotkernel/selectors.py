@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
+from contextlib import contextmanager
+from functools import lru_cache
+from robotkernel.constants import COMPLETION_CACHE_SIZE
 from robotkernel.exceptions import BrokenOpenConnection
+from weakref import WeakKeyDictionary
+import json
 import os
-import pkg_resources
 import re
+import threading
 import time
 
 
@@ -55,11 +63,17 @@ IS_CSS_SELECTOR_NEEDLE = re.compile(r"^css=|^css:")
 IS_TAG_SELECTOR_NEEDLE = re.compile(r"^tag=|^tag:")
 IS_LINK_SELECTOR_NEEDLE = re.compile(r"^link=|^link:|" r"^partial link:|^partial link=")
 IS_XPATH_SELECTOR_NEEDLE = re.compile(r"^xpath=|^xpath:")
+SIMMER_JS = os.path.join(
+    os.path.dirname(__file__), "resources", "simmerjs", "simmer.js"
+)
 FORM_TAG_NAMES = ["input", "textarea", "select", "button", "datalist"]
 IS_TEXT = re.compile(r"^[\w\s]+$", re.U)
 
 SELECTOR_HIGHLIGHT_STYLE_SCRIPT = """
 (function() {
+  if (document.querySelector('style[data-name="robotkernel"]')) {
+    return;
+  }
   var node = document.createElement('style');
   node.setAttribute('data-name', 'robotkernel');
   node.innerHTML = '' +
@@ -106,6 +120,93 @@ SELECTOR_HIGHLIGHT_STYLE_SCRIPT = """
 })();
 """
 
+SELECTOR_QUERY_SCRIPT = """
+var strategy = arguments[0], needle = arguments[1], simmer = arguments[2];
+var highlights = arguments[4], snapshot = window.robotkernelSnapshot;
+var elements = [];
+if (!window.Simmer ||
+    !document.querySelector('style[data-name="robotkernel"]')) {
+  return {inject: true};
+}
+if (!snapshot) {
+  snapshot = window.robotkernelSnapshot = {
+    id: Date.now().toString(36) + Math.random().toString(36).slice(2),
+    mutations: 0
+  };
+  new MutationObserver(function(mutations) {
+    if (mutations.some(function(m) {
+      return m.attributeName !== 'data-robotkernel';
+    })) {
+      snapshot.mutations++;
+    }
+  }).observe(document, {
+    attributes: true, characterData: true, childList: true, subtree: true
+  });
+}
+var state = [location.href, snapshot.id, snapshot.mutations];
+if (!strategy || JSON.stringify(state) === JSON.stringify(arguments[3])) {
+  if (highlights) {
+    Array.prototype.forEach.call(
+      document.querySelectorAll('[data-robotkernel]'), function(el) {
+        el.removeAttribute('data-robotkernel');
+      });
+    highlights.forEach(function(highlight) {
+      highlight[0].setAttribute('data-robotkernel', highlight[1]);
+    });
+  }
+  return {state: state, records: null};
+}
+if (strategy === 'snapshot') {
+  elements = document.querySelectorAll('[id], [name], a');
+} else if (strategy === 'css' && needle) {
+  elements = document.querySelectorAll(needle);
+} else if (strategy === 'xpath' && needle) {
+  var result = document.evaluate(
+    needle, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+  for (var i = 0; i < result.snapshotLength; i++) {
+    if (result.snapshotItem(i).nodeType === Node.ELEMENT_NODE) {
+      elements.push(result.snapshotItem(i));
+    }
+  }
+}
+var records = Array.prototype.map.call(elements, function(el) {
+  var style = window.getComputedStyle(el);
+  var tag = el.tagName.toLowerCase();
+  return {
+    element: el,
+    id: el.getAttribute('id') || '',
+    name: el.getAttribute('name') || '',
+    tag: tag,
+    text: tag === 'a' ? (el.innerText || '').trim() : '',
+    visible: !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length) &&
+      style.visibility !== 'hidden',
+    simmer: ''
+  };
+});
+if (simmer) {
+  var visible = records.filter(function(r) { return r.visible; });
+  (visible.length ? visible : records).forEach(function(r) {
+    if (simmer === 'all' || !(r.id ||
+        (FORM_TAG_NAMES.indexOf(r.tag) > -1 && r.name) ||
+        (simmer === 'links' && r.tag === 'a' && r.text))) {
+      r.simmer = window.Simmer(r.element) || '';
+    }
+  });
+}
+return {state: state, records: records};
+"""
+SELECTOR_QUERY_SCRIPT = SELECTOR_QUERY_SCRIPT.replace(
+    "FORM_TAG_NAMES", json.dumps(FORM_TAG_NAMES)
+)
+
+
+SELECTOR_CLEAR_SCRIPT = """
+Array.prototype.forEach.call(
+  document.querySelectorAll('[data-robotkernel]'), function(el) {
+    el.removeAttribute('data-robotkernel');
+  });
+"""
+
 
 def is_selenium_selector(needle):
     return bool(IS_SELENIUM_SELECTOR_NEEDLE.match(needle))
@@ -130,75 +231,138 @@ def is_selector(needle):
     return is_selenium_selector(needle) or is_appium_selector(needle)
 
 
-def get_element_highlight_script(results, old_elements):
-    script = ""
-    counter = 0
-    arguments = []
-    elements = [r[1] for r in results]
-    for element in old_elements:
-        if element not in elements:
-            script += f'arguments[{counter:d}].removeAttribute("data-robotkernel");'
-            arguments.append(element)
-            counter += 1
-    for completion, element in results:
-        if element not in old_elements:
-            script += (
-                f"arguments[{counter:d}].setAttribute("
-                f'"data-robotkernel", "{completion}");'
-            )
-            arguments.append(element)
-            counter += 1
-    return script, arguments
-
-
-def clear_selector_highlights(driver):
+def clear_selector_highlights(driver, cache=None):
+    """Remove selector completion highlights from the page of the driver."""
+    snapshot = cache.get(driver) if cache is not None else None
+    if cache is not None and not (snapshot and snapshot["highlighted"]):
+        return
     try:
-        script, arguments = get_element_highlight_script(
-            [], driver.find_elements("css selector", "[data-robotkernel]")
-        )
+        driver.execute_script(SELECTOR_CLEAR_SCRIPT)
     except InvalidSessionIdException as e:
         raise BrokenOpenConnection(driver) from e
     except WebDriverException:
-        return
-    if script:
-        driver.execute_script(script, *arguments)
+        pass
+    if snapshot:
+        snapshot["highlighted"] = False
 
 
-def get_selector_completions(needle, driver):
+def get_selector_completions(needle, driver, cache=None, cancelled=None):
     if repr(driver).startswith("<appium.webdriver"):
         return get_appium_selector_completions(needle, driver)
     else:
-        return get_selenium_selector_completions(needle, driver)
-
-
-def get_selenium_selector_completions(needle, driver):
-    try:
-        # Inject supporting JS and CSS
-        styles = 'style[data-name="robotkernel"]'
-        if not driver.find_elements("css selector", styles):
-            with pkg_resources.resource_stream(
-                "robotkernel", "resources/simmerjs/simmer.js"
-            ) as fp:
-                driver.execute_script(
-                    fp.read().decode("utf-8") + SELECTOR_HIGHLIGHT_STYLE_SCRIPT
+        return get_selenium_selector_completions(needle, driver, cache, cancelled)
+
+
+class SelectorCompleter:
+    """Run selector completions one at a time with a deadline."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.executor = None
+        self.pending = None  # (driver, needle, future, cancelled)
+        self.results = WeakKeyDictionary()  # recent results by driver and needle
+        self.lock = threading.Lock()  # held while the drivers are used
+        self.held = False  # by idle (e.g. for a cell execution)
+
+    def complete(self, needle, driver, cache=None):
+        if self.held:  # do not queue completions behind a cell execution
+            return self.get_previous(needle, driver)
+        pending = self.pending
+        if pending is not None and pending[0] is driver and pending[1] == needle:
+            future = pending[2]
+        else:
+            self.cancel()
+            cancelled = threading.Event()
+            try:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(
+                        1, thread_name_prefix="robotkernel-selectors"
+                    )
+                future = self.executor.submit(
+                    self.run, needle, driver, cache, cancelled
                 )
-        can_highlight = True
-    except WebDriverException:
-        can_highlight = False
+            except RuntimeError:  # no threads (e.g. on pyolite)
+                return self.run(needle, driver, cache, cancelled)
+            self.pending = (driver, needle, future, cancelled)
+        try:
+            matches = future.result(self.timeout)
+        except TimeoutError:
+            return self.get_previous(needle, driver)
+        self.pending = None
+        return matches
+
+    def run(self, needle, driver, cache, cancelled):
+        with self.lock:
+            if cancelled.is_set():  # while waiting for the lock
+                return self.get_previous(needle, driver)
+            matches = get_selector_completions(needle, driver, cache, cancelled)
+        # Results are replaced instead of mutated, because they are read from
+        # the kernel thread
+        results = OrderedDict(self.results.get(driver) or ())
+        results.pop(needle, None)
+        results[needle] = matches
+        if len(results) > COMPLETION_CACHE_SIZE:
+            results.popitem(last=False)
+        self.results[driver] = results
+        return matches
+
+    def get_previous(self, needle, driver):
+        """Return the recent results of the same or a shorter needle."""
+        results = self.results.get(driver) or {}
+        if needle in results:
+            return results[needle]
+        for previous in reversed(results):
+            if needle.startswith(previous):
+                return [m for m in results[previous] if m.startswith(needle)]
+        return []
 
-    # Get results
+    def cancel(self):
+        """Cancel the pending completion unless it has already finished."""
+        if self.pending is not None:
+            self.pending[2].cancel()
+            self.pending[3].set()
+            self.pending = None
+
+    @contextmanager
+    def idle(self, timeout: float):
+        """Cancel pending completion and yield True when drivers can be used."""
+        self.cancel()
+        acquired = self.lock.acquire(timeout=timeout)
+        self.held = acquired
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.held = False
+                self.lock.release()
+
+    def shutdown(self):
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+def get_selenium_selector_completions(needle, driver, cache=None, cancelled=None):
+    cache = {} if cache is None else cache
     try:
-        results = _get_selenium_selector_completions(needle, driver)
+        # Get results (from the cached snapshot of the page when available)
+        results = _get_selenium_selector_completions(needle, driver, cache)
+        if cancelled is not None and cancelled.is_set():
+            return [r[0] for r in results]  # superseded: do not highlight
+        # Highlight results unless the page has changed since the snapshot
+        if cache.get(driver, {}).get("volatile"):
+            highlight_selector_completions(driver, results, cache, verify=False)
+        elif not highlight_selector_completions(driver, results, cache):
+            # Page changed, and may keep changing: results from the new snapshot
+            # are highlighted without verifying them again, and the page is
+            # queried again on the next completions until found unchanged
+            results = _get_selenium_selector_completions(needle, driver, cache)
+            highlight_selector_completions(driver, results, cache, verify=False)
+            if driver in cache:
+                cache[driver]["volatile"] = True
     except WebDriverException as e:
         return ["Exception (press esc to clear):", str(e)]
 
-    # Highlight
-    if can_highlight:
-        script, arguments = get_element_highlight_script(
-            results, driver.find_elements("css selector", "[data-robotkernel]")
-        )
-        driver.execute_script(script, *arguments)
-
     # Return
     return [r[0] for r in results]
 
@@ -262,19 +426,19 @@ def get_white_selector_completions(needle, driver=PickSnipTool):
         return []
 
 
-def _get_selenium_selector_completions(needle, driver):
+def _get_selenium_selector_completions(needle, driver, cache=None):
     if IS_ID_SELECTOR_NEEDLE.match(needle):
-        return get_selenium_id_selector_completions(needle, driver)
+        return get_selenium_id_selector_completions(needle, driver, cache)
     elif IS_NAME_SELECTOR_NEEDLE.match(needle):
-        return get_selenium_name_selector_completions(needle, driver)
+        return get_selenium_name_selector_completions(needle, driver, cache)
     elif IS_CSS_SELECTOR_NEEDLE.match(needle):
-        return get_selenium_css_selector_completions(needle, driver)
+        return get_selenium_css_selector_completions(needle, driver, cache)
     elif IS_TAG_SELECTOR_NEEDLE.match(needle):
-        return get_selenium_tag_selector_completions(needle, driver)
+        return get_selenium_tag_selector_completions(needle, driver, cache)
     elif IS_LINK_SELECTOR_NEEDLE.match(needle):
-        return get_selenium_link_selector_completions(needle, driver)
+        return get_selenium_link_selector_completions(needle, driver, cache)
     elif IS_XPATH_SELECTOR_NEEDLE.match(needle):
-        return get_selenium_xpath_selector_completions(needle, driver)
+        return get_selenium_xpath_selector_completions(needle, driver, cache)
     else:
         return []
 
@@ -297,38 +461,99 @@ def _get_autoit_selector_completions(needle, driver):
         return []
 
 
-def get_simmer_matches(elements, driver):
-    matches = []
-    if elements:
-        script = "return ["
-        script += ", ".join(
-            [f"window.Simmer(arguments[{idx:d}])" for idx in range(len(elements))]
+@lru_cache(maxsize=None)
+def get_selector_support_script():
+    """Return Simmer and the highlight styles to be injected into pages."""
+    with open(SIMMER_JS, "rb") as fp:
+        return fp.read().decode("utf-8") + SELECTOR_HIGHLIGHT_STYLE_SCRIPT
+
+
+def execute_selector_script(driver, cache, key, state=None, highlights=None):
+    """Query or highlight elements and update the page snapshot."""
+    arguments = (*key, state, highlights)
+    result = None
+    if driver in cache:  # supporting JS and CSS have been injected before
+        result = driver.execute_script(SELECTOR_QUERY_SCRIPT, *arguments)
+    if result is None or result.get("inject"):
+        result = driver.execute_script(
+            get_selector_support_script() + SELECTOR_QUERY_SCRIPT, *arguments
         )
-        script += "];"
-        results = driver.execute_script(script, *elements)
-        for idx in range(len(results)):
-            if results[idx]:
-                matches.append((f"css:{results[idx]}", elements[idx]))
-    return matches
+    snapshot = cache.get(driver)
+    if snapshot is None or snapshot["state"] != result["state"]:
+        highlighted = bool(snapshot and snapshot["highlighted"])
+        volatile = bool(
+            snapshot
+            and snapshot.get("volatile")
+            and (snapshot["state"] or [])[:2] == result["state"][:2]
+        )
+        snapshot = cache[driver] = {
+            "state": result["state"],
+            "queries": {},
+            "highlighted": highlighted,  # until cleared
+            "volatile": volatile,  # until the same page is found unchanged
+        }
+    elif result["records"] is not None:
+        snapshot["volatile"] = False
+    if result["records"] is not None:
+        snapshot["queries"][key] = result["records"]
+        snapshot["last"] = key
+        if len(snapshot["queries"]) > COMPLETION_CACHE_SIZE:
+            del snapshot["queries"][next(iter(snapshot["queries"]))]
+    return result
+
+
+def query_selenium_elements(driver, strategy, needle, simmer=False, cache=None):
+    """Return elements for the needle with their properties."""
+    cache = {} if cache is None else cache
+    key = (strategy, needle, simmer)
+    snapshot = cache.get(driver)
+    if snapshot and not snapshot.get("volatile") and key in snapshot["queries"]:
+        snapshot["last"] = key
+        return snapshot["queries"][key]
+    return execute_selector_script(driver, cache, key)["records"]
+
+
+def highlight_selector_completions(driver, results, cache, verify=True):
+    """Highlight results; return False if the page has changed."""
+    snapshot = cache.get(driver) or {"state": None}
+    key = verify and snapshot.get("last") or (None, "", False)
+    highlights = [[element, completion] for completion, element in results]
+    try:
+        result = execute_selector_script(
+            driver, cache, key, snapshot["state"], highlights
+        )
+    except WebDriverException:  # e.g. stale elements of a previous page
+        if driver in cache:
+            cache[driver].update({"state": None, "queries": {}})
+        return False
+    if result["records"] is None:
+        cache[driver]["highlighted"] = bool(highlights)
+    return result["records"] is None
+
+
+def get_snapshot_matches(driver, key, needle, cache=None):
+    """Return the elements with key (attribute) matching the needle exactly,
+    or when there are no exact matches, the ones containing the needle."""
+    records = query_selenium_elements(driver, "snapshot", "", cache=cache)
+    records = [r for r in records if r[key] and needle in r[key]]
+    return [r for r in records if r[key] == needle] or records
+
+
+def get_simmer_matches(records):
+    return [(f"css:{r['simmer']}", r["element"]) for r in records if r["simmer"]]
 
 
 def visible_or_all(results):
     return list(filter(lambda e: e.is_displayed(), results)) or results
 
 
-def get_selenium_id_selector_completions(needle, driver):
-    needle = needle[3:]
-    matches = []
-    if needle:
-        results = driver.find_elements(
-            "css selector", f'[id="{needle}"]'
-        ) or driver.find_elements("css selector", f'[id*="{needle}"]')
-    else:
-        results = driver.find_elements("xpath", "//*[@id]")
-    for result in visible_or_all(results):
-        id_ = result.get_attribute("id")
-        matches.append((f"id:{id_}", result))
-    return matches
+def visible_records_or_all(records):
+    return [r for r in records if r["visible"]] or records
+
+
+def get_selenium_id_selector_completions(needle, driver, cache=None):
+    records = get_snapshot_matches(driver, "id", needle[3:], cache)
+    return [(f"id:{r['id']}", r["element"]) for r in visible_records_or_all(records)]
 
 
 def get_appium_id_selector_completions(needle, driver):
@@ -346,22 +571,15 @@ def get_appium_id_selector_completions(needle, driver):
     return matches
 
 
-def get_selenium_name_selector_completions(needle, driver):
-    needle = needle[5:]
-    matches = []
-    if needle:
-        results = driver.find_elements(
-            "css selector", f'[name="{needle}"]'
-        ) or driver.find_elements("css selector", f'[name*="{needle}"]')
-    else:
-        results = driver.find_elements("xpath", "//*[@name]")
-    for result in visible_or_all(results):
-        name = result.get_attribute("name")
-        matches.append((f"name:{name}", result))
-    return matches
+def get_selenium_name_selector_completions(needle, driver, cache=None):
+    records = get_snapshot_matches(driver, "name", needle[5:], cache)
+    return [
+        (f"name:{r['name']}", r["element"]) for r in visible_records_or_all(records)
+    ]
 
 
-def get_selenium_needle_from_user(driver):
+def get_selenium_needle_from_user(driver, cache=None):
+    execute_selector_script(driver, {} if cache is None else cache, (None, "", False))
     try:
         return (
             driver.execute_async_script(
@@ -393,90 +611,74 @@ if (node) { node.parentNode.removeChild(node); }
         return ""
 
 
-def get_selenium_css_selector_completions(needle, driver):
+def get_selenium_css_selector_completions(needle, driver, cache=None):
     needle = needle[4:]
     unresolved = []
-    results = []
+    records = []
     matches = []
     if not needle:
-        needle = get_selenium_needle_from_user(driver)
+        needle = get_selenium_needle_from_user(driver, cache)
     if needle:
-        results = driver.find_elements("css selector", needle)
-    for result in visible_or_all(results):
-        id_ = result.get_attribute("id")
+        simmer = "all" if " " in needle else "links"
+        records = query_selenium_elements(driver, "css", needle, simmer, cache)
+    for record in visible_records_or_all(records):
         if " " in needle:  # always include simmer result for complex needles
-            unresolved.append(result)
-        if id_:
-            matches.append((f"id:{id_}", result))
+            unresolved.append(record)
+        if record["id"]:
+            matches.append((f"id:{record['id']}", record["element"]))
             continue
-        if result.tag_name in FORM_TAG_NAMES and result.get_attribute("name"):
-            name = result.get_attribute("name")
-            matches.append((f"name:{name}", result))
+        if record["tag"] in FORM_TAG_NAMES and record["name"]:
+            matches.append((f"name:{record['name']}", record["element"]))
             continue
-        if result.tag_name == "a" and result.text:
-            matches.append((f"link:{result.text}", result))
+        if record["tag"] == "a" and record["text"]:
+            matches.append((f"link:{record['text']}", record["element"]))
             continue
         if " " not in needle:
-            unresolved.append(result)
-    matches.extend(get_simmer_matches(unresolved, driver))
+            unresolved.append(record)
+    matches.extend(get_simmer_matches(unresolved))
     return matches
 
 
-def get_selenium_tag_selector_completions(needle, driver):
-    needle = needle[4:]
+def get_resolved_matches(records):
     unresolved = []
-    results = []
     matches = []
-    if needle:
-        results = driver.find_elements("css selector", needle)
-    for result in visible_or_all(results):
-        id_ = result.get_attribute("id")
-        if id_:
-            matches.append((f"id:{id_}", result))
+    for record in visible_records_or_all(records):
+        if record["id"]:
+            matches.append((f"id:{record['id']}", record["element"]))
+            continue
+        if record["tag"] in FORM_TAG_NAMES and record["name"]:
+            matches.append((f"name:{record['name']}", record["element"]))
             continue
-        if result.tag_name in FORM_TAG_NAMES:
-            name = result.get_attribute("name")
-            if name:
-                matches.append((f"name:{name}", result))
-                continue
-        unresolved.append(result)
-    matches.extend(get_simmer_matches(unresolved, driver))
+        unresolved.append(record)
+    matches.extend(get_simmer_matches(unresolved))
     return matches
 
 
-def get_selenium_link_selector_completions(needle, driver):
-    needle = needle[5:]
-    matches = []
+def get_selenium_tag_selector_completions(needle, driver, cache=None):
+    needle = needle[4:]
+    records = []
     if needle:
-        results = driver.find_elements("partial link text", needle)
-    else:
-        results = driver.find_elements("xpath", "//a")
-    for result in visible_or_all(results):
-        if result.text:
-            matches.append((f"link:{result.text}", result))
-    return matches
+        records = query_selenium_elements(driver, "css", needle, "unresolved", cache)
+    return get_resolved_matches(records)
+
+
+def get_selenium_link_selector_completions(needle, driver, cache=None):
+    needle = needle[5:]
+    records = query_selenium_elements(driver, "snapshot", "", cache=cache)
+    records = [r for r in records if r["tag"] == "a" and needle in r["text"]]
+    return [
+        (f"link:{r['text']}", r["element"])
+        for r in visible_records_or_all(records)
+        if r["text"]
+    ]
 
 
-def get_selenium_xpath_selector_completions(needle, driver):
+def get_selenium_xpath_selector_completions(needle, driver, cache=None):
     needle = needle[6:]
-    results = []
-    matches = []
-    unresolved = []
+    records = []
     if needle:
-        results = driver.find_elements("xpath", needle)
-    for result in visible_or_all(results):
-        id_ = result.get_attribute("id")
-        if id_:
-            matches.append((f"id:{id_}", result))
-            continue
-        if result.tag_name in FORM_TAG_NAMES:
-            name = result.get_attribute("name")
-            if name:
-                matches.append((f"name:{name}", result))
-                continue
-        unresolved.append(result)
-    matches.extend(get_simmer_matches(unresolved, driver))
-    return matches
+        records = query_selenium_elements(driver, "xpath", needle, "unresolved", cache)
+    return get_resolved_matches(records)
 
 
 def get_appium_xpath_selector_completions(needle, driver):
@@ -1,21 +1,18 @@
 # -*- coding: utf-8 -*-
-from copy import deepcopy
-from difflib import SequenceMatcher
+from collections import OrderedDict
 from IPython.core.display import Image
 from IPython.core.display import JSON
 from json import JSONDecodeError
-from lunr.builder import Builder
-from lunr.stemmer import stemmer
-from lunr.stop_word_filter import stop_word_filter
-from lunr.trimmer import trimmer
 from operator import itemgetter
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import get_lexer_by_name
+from robotkernel.constants import COMPLETION_CACHE_SIZE
 from robotkernel.constants import HAS_RF32_PARSER
+from robotkernel.constants import KEYWORD_DOC_CACHE_SIZE
+from robotkernel.constants import MAX_COMPLETIONS
 import base64
+import bisect
+import heapq
 import json
 import os
-import pygments
 import re
 
 
@@ -62,7 +59,14 @@ def data_uri(mimetype, data):
     )
 
 
+# Pygments and lunr are imported on demand for faster kernel startup
+
+
 def highlight(language, data):
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name
+    import pygments
+
     lexer = get_lexer_by_name(language)
     formatter = HtmlFormatter(noclasses=True, nowrap=True)
     return pygments.highlight(data, lexer, formatter)
@@ -74,6 +78,11 @@ def lunr_builder(ref, fields):
     Returns:
         Index: The populated Index ready to search against.
     """
+    from lunr.builder import Builder
+    from lunr.stemmer import stemmer
+    from lunr.stop_word_filter import stop_word_filter
+    from lunr.trimmer import trimmer
+
     builder = Builder()
     builder.pipeline.add(trimmer, stop_word_filter, stemmer)
     builder.search_pipeline.add(stemmer)
@@ -83,6 +92,126 @@ def lunr_builder(ref, fields):
     return builder
 
 
+class LunrIndex:
+    """Searchable index composed of lunr index segments by library or resource."""
+
+    def __init__(self, ref, fields):
+        self.ref = ref
+        self.fields = fields
+        self.segments = OrderedDict()
+        self.documents = {}
+        self.tokens = {}  # indexed tokens by ref for every segment
+        self.version = 0  # incremented on every change
+
+    def __len__(self):
+        return sum(map(len, self.documents.values()))
+
+    def update(self, name, documents):
+        """Add or replace the named segment, unless its documents are unchanged."""
+        documents = list(documents)
+        if documents == self.documents.get(name):
+            return
+        self.segments.pop(name, None)
+        self.documents.pop(name, None)
+        self.tokens.pop(name, None)
+        self.version += 1
+        if documents:
+            builder = lunr_builder(self.ref, self.fields)
+            for document in documents:
+                builder.add(document)
+            segment = builder.build()
+            tokens = {}
+            for token, postings in segment.inverted_index.items():
+                for field in self.fields:
+                    for ref in postings.get(field, ()):
+                        tokens.setdefault(ref, set()).add(token)
+            self.segments[name] = segment
+            self.documents[name] = documents
+            self.tokens[name] = tokens
+
+    def contains(self, ref, term):
+        """Return True when term is found in the indexed tokens of ref."""
+        for tokens in list(self.tokens.values()):
+            if any(term in token for token in tokens.get(ref, ())):
+                return True
+        return False
+
+    def search(self, query):
+        results = []
+        for index in list(self.segments.values()):
+            results.extend(index.search(query))
+        return sorted(results, key=itemgetter("score"), reverse=True)
+
+
+class KeywordNames:
+    """Lookup table of keyword refs by normalized (library prefixed) name."""
+
+    def __init__(self):
+        self.segments = {}
+        self.refs = {}  # sorted (is library, ref) pairs by normalized name
+        self.names = []  # sorted normalized names
+
+    def __len__(self):
+        return len(self.names)
+
+    def update(self, name, keywords):
+        """Add or replace the named segment with (ref, keyword name) pairs."""
+        segment = []
+        for ref, keyword_name in keywords:
+            # library keywords sort after suite and resource keywords
+            segment.append((normalize_keyword(keyword_name), ref != keyword_name, ref))
+            if ref != keyword_name:
+                segment.append((normalize_keyword(ref), True, ref))
+        previous = self.segments.get(name, [])
+        if segment == previous:
+            return
+        segments = dict(self.segments)
+        if segment:
+            segments[name] = segment
+        else:
+            segments.pop(name, None)
+        refs = dict(self.refs)
+        changed = {}
+        for normalized, is_library, ref in previous:
+            matches = changed.setdefault(normalized, list(refs[normalized]))
+            matches.remove((is_library, ref))
+        for normalized, is_library, ref in segment:
+            matches = changed.setdefault(normalized, list(refs.get(normalized, [])))
+            bisect.insort(matches, (is_library, ref))
+        added, removed = [], set()
+        for normalized, matches in changed.items():
+            if not matches:
+                removed.add(normalized)
+                del refs[normalized]
+                continue
+            if normalized not in refs:
+                added.append(normalized)
+            refs[normalized] = matches
+        names = self.names
+        if removed:
+            names = [normalized for normalized in names if normalized not in removed]
+        if added:
+            names = list(heapq.merge(names, sorted(added)))
+        self.segments, self.refs, self.names = segments, refs, names
+
+    def find(self, needle):
+        """Return the ref of the keyword named by needle or None."""
+        refs = self.refs.get(normalize_keyword(needle))
+        return refs and refs[0][1] or None
+
+    def complete(self, needle):
+        """Return the refs of the keywords with names starting with needle."""
+        needle = normalize_keyword(needle)
+        names = self.names
+        refs = []
+        if needle:
+            for name in names[bisect.bisect_left(names, needle) :]:
+                if not name.startswith(needle):
+                    break
+                refs.extend(ref for is_library, ref in self.refs.get(name, []))
+        return refs
+
+
 def readable_keyword(s):
     """Return keyword with only the first letter in title case."""
     if s and not s.startswith("*") and not s.startswith("["):
@@ -154,14 +283,47 @@ def get_keyword_doc(keyword):
     }
 
 
-def scored_results(needle, results):
-    results = deepcopy(results)
-    for result in results:
-        match = SequenceMatcher(
-            None, needle.lower(), result["ref"].lower(), autojunk=False
-        ).find_longest_match(0, len(needle), 0, len(result["ref"]))
-        result["score"] = (match.size, match.size / float(len(result["ref"])))
-    return list(reversed(sorted(results, key=itemgetter("score"))))
+def get_cached_keyword_doc(ref, keyword, cache):
+    """Return documentation for the keyword rendered once per keyword object."""
+    cached = cache.get(ref)
+    if cached is None or cached[0] is not keyword:
+        cached = cache[ref] = (keyword, get_keyword_doc(keyword))
+        while len(cache) > KEYWORD_DOC_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(ref)
+    return cached[1]
+
+
+def normalize_keyword(name):
+    """Return keyword name normalized to ignore case, spaces and underscores."""
+    return re.sub(r"[\s_]+", "", name).lower()
+
+
+def longest_common_substring_size(needle, haystack):
+    """Return the length of the longest common substring of the arguments."""
+    if needle in haystack:
+        return len(needle)
+    for size in range(len(needle) - 1, 0, -1):
+        for start in range(len(needle) - size + 1):
+            if needle[start : start + size] in haystack:
+                return size
+    return 0
+
+
+def scored_results(needle, results, limit=None):
+    """Return results ordered by their longest common substring with needle."""
+    needle = needle.lower()
+    scores = []
+    for idx, result in enumerate(results):
+        ref = result["ref"].lower()
+        size = longest_common_substring_size(needle, ref)
+        scores.append((size, size / float(len(ref) or 1), idx))
+    if limit is None:
+        scores.sort(reverse=True)
+    else:
+        scores = heapq.nlargest(limit, scores)
+    return [results[score[2]] for score in scores]
 
 
 def lunr_query(query):
@@ -170,27 +332,74 @@ def lunr_query(query):
     return f"*{query.strip().lower()}*"
 
 
-def get_lunr_completions(needle, index, keywords, context):
+def get_lunr_results(needle, catalog, cache=None):
+    """Return unique search results for the completion needle."""
+    index, keywords = catalog["index"], catalog["keywords"]
+    term = needle.strip().lower()
+    if not term:
+        return []
+    key = (index.version, term)
+    if cache is not None and key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    results = None
+    if cache is not None and re.match(r"[\w.]+$", term):
+        for size in range(len(term) - 1, 0, -1):
+            previous = cache.get((index.version, term[:size]))
+            if previous is not None:
+                # Narrowed like searched: by the index tokens and the names
+                prefix = normalize_keyword(term)
+                results = [
+                    result
+                    for result in previous
+                    if index.contains(result["ref"], term)
+                    or normalize_keyword(result["ref"]).startswith(prefix)
+                    or normalize_keyword(keywords[result["ref"]].name).startswith(
+                        prefix
+                    )
+                ]
+                break
+    if results is None:
+        results = {}
+        for result in index.search(lunr_query(needle)):
+            results.setdefault(result["ref"], result)
+        for ref in catalog["names"].complete(needle):
+            results.setdefault(ref, {"ref": ref})
+        results = list(results.values())
+    if cache is not None:
+        cache[key] = results
+        while len(cache) > COMPLETION_CACHE_SIZE:
+            cache.popitem(last=False)
+    return results
+
+
+def is_in_context(ref, context):
+    """Return True when the keyword ref can be completed in the context."""
+    if ref.startswith("__") and not ref.startswith(context):
+        return False
+    return ref.startswith(context) or context in [
+        "__tasks__",
+        "__keywords__",
+        "__settings__",
+    ]
+
+
+def get_lunr_completions(needle, catalog, context, cache=None):
+    keywords = catalog["keywords"]
     matches = []
-    results = []
-    if needle.rstrip():
-        query = lunr_query(needle)
-        results = index.search(query)
-        results += index.search(query.strip("*"))
-    for result in scored_results(needle, results):
+    results = [
+        result
+        for result in get_lunr_results(needle, catalog, cache)
+        if is_in_context(result["ref"], context)
+    ]
+    seen = set()
+    for result in scored_results(needle, results, MAX_COMPLETIONS):
         ref = result["ref"]
-        if ref.startswith("__") and not ref.startswith(context):
-            continue
-        if not ref.startswith(context) and context not in [
-            "__tasks__",
-            "__keywords__",
-            "__settings__",
-        ]:
-            continue
         if not needle.count("."):
-            keyword = keywords[ref].name
-            if keyword not in matches:
-                matches.append(readable_keyword(keyword))
+            keyword = readable_keyword(keywords[ref].name)
+            if keyword not in seen:
+                seen.add(keyword)
+                matches.append(keyword)
         else:
             matches.append(readable_keyword(ref))
     return matches
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+from io import StringIO
+from io import TextIOBase
+from robot.api import ExecutionResult
+from robot.errors import DataError
+from robot.output import LOGGER
+from robot.running.signalhandler import STOP_SIGNAL_MONITOR
+from robotkernel.builders import build_suite
+from robotkernel.listeners import AppiumConnectionsListener
+from robotkernel.listeners import get_library_documentation
+from robotkernel.listeners import JupyterConnectionsListener
+from robotkernel.listeners import ReturnValueListener
+from robotkernel.listeners import RobotKeywordsIndexerListener
+from robotkernel.listeners import RobotVariablesListener
+from robotkernel.listeners import SeleniumConnectionsListener
+from robotkernel.listeners import StatusEventListener
+from robotkernel.listeners import StickyLibraryListener
+from robotkernel.listeners import WhiteLibraryListener
+from robotkernel.monkeypatches import inject_libdoc_ipynb_support
+from robotkernel.monkeypatches import inject_robot_ipynb_support
+from robotkernel.parallel import get_picklable
+from traceback import format_exc
+from typing import Dict
+import multiprocessing
+import os
+import pickle
+import re
+import signal
+import sys
+
+# Listeners in the kernel process receiving the events from the worker
+FORWARDED_LISTENERS = (StatusEventListener, RobotKeywordsIndexerListener)
+
+# Listeners keeping connections or library instances in the kernel process
+KERNEL_PROCESS_LISTENERS = (
+    SeleniumConnectionsListener,
+    JupyterConnectionsListener,
+    AppiumConnectionsListener,
+    WhiteLibraryListener,
+    StickyLibraryListener,
+)
+
+# Libraries with connections kept between cells by KERNEL_PROCESS_LISTENERS
+KERNEL_PROCESS_LIBRARIES = {
+    "SeleniumLibrary",
+    "Selenium2Library",
+    "JupyterLibrary",
+    "AppiumLibrary",
+    "WhiteLibrary",
+}
+
+# Parsed history models of the worker process by cell id
+MODEL_CACHE = {}
+
+# Libraries of the worker process already documented for the kernel
+DOCUMENTED_LIBRARIES = set()
+
+
+class WorkerError(RuntimeError):
+    """Worker process exited unexpectedly."""
+
+
+class EventForwarder:
+    """Forward listener events to the kernel process."""
+
+    ROBOT_LISTENER_API_VERSION = 2
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def forward(self, method, name, attributes):
+        self.connection.send(("event", method, name, get_picklable(attributes)))
+
+    def start_test(self, name, attributes):
+        self.forward("start_test", name, attributes)
+
+    def end_test(self, name, attributes):
+        self.forward("end_test", name, attributes)
+
+    def start_keyword(self, name, attributes):
+        self.forward("start_keyword", name, attributes)
+
+    def end_keyword(self, name, attributes):
+        self.forward("end_keyword", name, attributes)
+
+    def library_import(self, name, attributes):
+        # Documented here, where the library has been imported, so that the
+        # kernel process can index it without importing it
+        if name not in DOCUMENTED_LIBRARIES:
+            DOCUMENTED_LIBRARIES.add(name)
+            source = attributes.get("source")
+            for candidate in (attributes.get("originalName") or name, source):
+                try:
+                    lib_doc = get_library_documentation(candidate, source)
+                    attributes = dict(attributes, libdoc=lib_doc.to_json())
+                    break
+                except (AttributeError, DataError):  # to_json on RF >= 4.0
+                    continue
+        self.forward("library_import", name, attributes)
+
+    def resource_import(self, name, attributes):
+        self.forward("resource_import", name, attributes)
+
+
+class ConnectionWriter(TextIOBase):
+    """Forward console output (e.g. robot.api.logger.console) to the kernel."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def write(self, s):
+        self.connection.send(("write", s))
+        return len(s)
+
+
+def requires_kernel_process(suite, listeners: list) -> bool:
+    """Return True when the suite must be run in the kernel process."""
+    names = set()
+    for import_data in suite.resource.imports:
+        if import_data.type.upper() == "LIBRARY":  # "LIBRARY" on RF >= 7
+            names.add(re.sub(r"\.py$", "", os.path.basename(import_data.name)))
+    for listener in listeners:
+        if isinstance(listener, RobotKeywordsIndexerListener):
+            names.update(listener.catalog["libraries"])  # e.g. from resources
+        elif isinstance(listener, StickyLibraryListener) and listener.libraries:
+            return True
+        elif isinstance(listener, KERNEL_PROCESS_LISTENERS) and listener.drivers:
+            return True
+    return bool(names & KERNEL_PROCESS_LIBRARIES) or any(map(is_kernel_module, names))
+
+
+def is_kernel_module(name: str) -> bool:
+    """Return True when the named library is a module defined only in the
+    kernel process (e.g. with %%python module) and unknown to the worker."""
+    parts = name.split(".")
+    for idx in range(1, len(parts) + 1):
+        module = sys.modules.get(".".join(parts[:idx]))
+        if module is None or hasattr(module, "__path__"):
+            continue
+        spec = getattr(module, "__spec__", None)
+        if not getattr(module, "__file__", None) and not getattr(spec, "origin", None):
+            return True
+    return False
+
+
+def run_suite(
+    connection,
+    code: str,
+    history: Dict[str, str],
+    variables: dict,
+    outputdir: str,
+    loglevel: str,
+    cwd: str,
+    return_value: bool,
+):
+    """Run the suite built from code and history in the worker process."""
+    os.chdir(cwd)
+    suite = build_suite(code, history, cache=MODEL_CACHE)
+    for cell_id in set(MODEL_CACHE) - set(history):
+        del MODEL_CACHE[cell_id]
+    values = []
+    listeners = [EventForwarder(connection), RobotVariablesListener(variables)]
+    if return_value:
+        listeners.append(ReturnValueListener(values.append))
+    stdout = StringIO()
+    sys.__stdout__ = ConnectionWriter(connection)
+    try:
+        suite.run(
+            outputdir=outputdir, stdout=stdout, listener=listeners, loglevel=loglevel
+        )
+    finally:
+        sys.__stdout__ = sys.stdout
+    value = values[-1] if values else None
+    try:
+        pickle.dumps(value)
+    except Exception:  # noqa: B902
+        value = None
+    return stdout.getvalue(), get_picklable(variables), value
+
+
+def serve(connection):
+    """Serve suite runs requested over the connection until it is closed."""
+    if hasattr(os, "setsid"):
+        os.setsid()  # receive only the interrupts forwarded by the kernel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # while not running
+    inject_robot_ipynb_support()
+    inject_libdoc_ipynb_support()
+    while True:
+        try:
+            options = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        try:
+            reply = ("done",) + run_suite(connection, **options)
+        except Exception:  # noqa: B902
+            reply = ("error", format_exc())
+        connection.send(reply)
+
+
+class RobotWorker:
+    """Warm worker process for running robot suites in isolation."""
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def interrupt(self):
+        """Stop the running suite gracefully like on SIGINT."""
+        if os.name == "nt":
+            return  # only forced stop is possible on Windows
+        try:
+            os.kill(self.process.pid, signal.SIGINT)
+        except OSError:
+            pass
+
+    def close(self):
+        self.connection.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+
+    def run(
+        self,
+        code: str,
+        history: Dict[str, str],
+        outputdir: str,
+        stdout,
+        listener: list,
+        loglevel: str,
+    ):
+        """Run the suite built from code and history in the worker process."""
+        variables = {}
+        return_values = None
+        for candidate in listener:
+            if isinstance(candidate, RobotVariablesListener):
+                variables = candidate.variables
+            elif isinstance(candidate, ReturnValueListener):
+                return_values = candidate
+        forwarded = [c for c in listener if isinstance(c, FORWARDED_LISTENERS)]
+        self.connection.send(
+            dict(
+                code=code,
+                history=dict(history),
+                variables=get_picklable(variables),
+                outputdir=outputdir,
+                loglevel=loglevel,
+                cwd=os.getcwd(),
+                return_value=return_values is not None,
+            )
+        )
+        interrupted = False
+        try:
+            while True:
+                # noinspection PyProtectedMember
+                if STOP_SIGNAL_MONITOR._signal_count and not interrupted:
+                    self.interrupt()
+                    interrupted = True
+                try:
+                    if not self.connection.poll(0.25):
+                        if not self.process.is_alive():
+                            raise EOFError()
+                        continue
+                    message = self.connection.recv()
+                except (EOFError, OSError) as e:
+                    self.process.join(1)
+                    raise WorkerError(
+                        "Robot Framework worker process exited unexpectedly."
+                    ) from e
+                if message[0] == "event":
+                    for candidate in forwarded:
+                        method = getattr(candidate, message[1], None)
+                        if method is not None:
+                            method(message[2], message[3])
+                elif message[0] == "write":
+                    sys.__stdout__.write(message[1])
+                elif message[0] == "error":
+                    raise WorkerError(message[1])
+                else:
+                    console, returned_variables, value = message[1:]
+                    break
+        except KeyboardInterrupt:
+            self.process.kill()  # forced stop
+            raise
+
+        stdout.write(console)
+        variables.update(returned_variables)
+        if return_values is not None and value is not None:
+            return_values.callback(value)
+        # Like after TestSuite.run, results are written without console output
+        LOGGER.unregister_console_logger()
+        return ExecutionResult(os.path.join(outputdir, "output.xml"))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+class FakeKernel:
+    execution_count = 1
+
+    def __init__(self):
+        self.displayed = []
+        self.updates = []
+        self.errors = []
+
+    def send_display_data(self, data=None, metadata=None, display_id=None):
+        self.displayed.append((data, metadata))
+
+    def send_update_display_data(self, data=None, metadata=None, display_id=None):
+        self.updates.append(data["text/html"])
+
+    def send_error(self, content=None):
+        self.errors.append(content)
+
+
+@pytest.fixture
+def fake_kernel():
+    return FakeKernel()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from robotkernel.artifacts import ArtifactStore
+import os
+
+
+def write(path, size):
+    with open(path, "wb") as fp:
+        fp.write(b"x" * size)
+
+
+def test_temporary_store():
+    store = ArtifactStore()
+    assert not store.linkable
+    dirname = store.add("run")
+    assert os.path.isdir(dirname)
+    store.cleanup()
+    assert not os.path.exists(store.path)
+
+
+def test_evict_least_recently_modified(tmp_path):
+    write(tmp_path / "user.txt", 1000)
+    os.makedirs(tmp_path / "user" / "data")
+    other = ArtifactStore(str(tmp_path), 2500)
+    store = ArtifactStore(str(tmp_path), 2500)
+    assert store.linkable
+
+    write(os.path.join(other.add("a"), "output.xml"), 1000)
+    os.utime(os.path.join(other.path, "a"), (1, 1))
+    write(os.path.join(store.add("b"), "output.xml"), 1000)
+    os.utime(os.path.join(store.path, "b"), (2, 2))
+    write(os.path.join(store.add("c"), "output.xml"), 1000)
+    store.evict(keep="c")
+
+    assert not os.path.exists(other.path)
+    assert os.path.exists(os.path.join(store.path, "b"))
+    assert os.path.exists(os.path.join(store.path, "c"))
+    assert os.path.exists(tmp_path / "user.txt")
+    assert os.path.exists(tmp_path / "user" / "data")
+
+    write(os.path.join(store.path, "c", "log.html"), 1000)
+    store.evict(keep="c")
+    assert not os.path.exists(os.path.join(store.path, "b"))
+    assert os.path.exists(os.path.join(store.path, "c", "log.html"))
+
+
+def test_href(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = ArtifactStore("results dir")
+    href = store.href("run", "log.html")
+    assert href.startswith("results%20dir/robotkernel-")
+    assert href.endswith("/run/log.html")
@@ -27,3 +27,20 @@ def test_string():
     suite = build_suite(TEST_SUITE, {})
     assert len(suite.resource.keywords) == 1
     assert len(suite.tests) == 1
+
+
+def test_history_model_cache():
+    cache = {}
+    history = {"cell": TEST_SUITE}
+    suite = build_suite("", history, cache=cache)
+    assert len(suite.resource.keywords) == 1
+    assert len(suite.tests) == 0
+    model = cache["cell"][1]
+
+    build_suite("", history, cache=cache)
+    assert cache["cell"][1] is model
+
+    history["cell"] = TEST_SUITE.replace("Head", "First")
+    suite = build_suite("", history, cache=cache)
+    assert cache["cell"][1] is not model
+    assert suite.resource.keywords[0].name == "First"
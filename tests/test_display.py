@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from io import StringIO
+from robotkernel.display import ProgressUpdater
+import time
+
+
+def test_progress_updates_are_coalesced(fake_kernel):
+    progress = ProgressUpdater(fake_kernel, "display", StringIO())
+    progress.interval = 0.1
+    progress.update({"test": "Test"})
+    for idx in range(100):
+        progress.update({"keyword": f"Keyword {idx}"})
+    assert len(fake_kernel.updates) == 1
+    time.sleep(0.3)
+    assert len(fake_kernel.updates) == 2
+    assert fake_kernel.updates[-1].endswith(">Test | Keyword 99</pre>")
+
+    progress.update({"keyword": "Last"})
+    progress.update({"keyword": "Pending"})
+    progress.finish()
+    time.sleep(0.2)
+    assert fake_kernel.updates[-1].endswith(">Test | Last</pre>")
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from io import BytesIO
+from io import StringIO
+from PIL import Image
+from robot.running import model
+from robot.running.signalhandler import STOP_SIGNAL_MONITOR
+from robotkernel import executors
+from robotkernel.display import DisplayKernel
+from robotkernel.exceptions import ExecutionInProgress
+from robotkernel.executors import process_screenshots
+from robotkernel.executors import stop_robot_suite
+from robotkernel.utils import data_uri
+import base64
+import os
+import pytest
+import threading
+import time
+
+OUTPUT_XML = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<robot>
+<msg html="true">&lt;a href="shot.png"&gt;&lt;img src="shot.png" width="800px"&gt;&lt;/a&gt;</msg>
+<msg html="true">&lt;img src="missing.png"&gt; &lt;a href="http://example.com"&gt;</msg>
+<msg html="true">&lt;a href="shot.png"&gt;link&lt;/a&gt;</msg>
+<msg html="true">&lt;a href="large.png"&gt;&lt;img src="shot.png"&gt;&lt;/a&gt;</msg>
+</robot>
+"""
+
+
+def test_process_screenshots(tmp_path, fake_kernel):
+    Image.new("RGB", (10, 5), "red").save(tmp_path / "shot.png")
+    with open(tmp_path / "shot.png", "rb") as fp:
+        uri = data_uri("image/png", fp.read())
+    with open(tmp_path / "output.xml", "w", encoding="utf-8") as fp:
+        fp.write(OUTPUT_XML)
+
+    process_screenshots(fake_kernel, str(tmp_path), False)
+
+    with open(tmp_path / "output.xml", encoding="utf-8") as fp:
+        xml = fp.read()
+    assert f'&lt;a&gt;&lt;img src="{uri}" style="max-width:800px;"&gt;' in xml
+    assert 'img src="missing.png"' in xml
+    assert 'a href="http://example.com"' in xml
+    assert '&lt;a href="shot.png"&gt;link' in xml
+    assert f'&lt;a href="large.png"&gt;&lt;img src="{uri}"&gt;' in xml
+    assert not os.path.exists(tmp_path / "output.xml.tmp")
+    assert len(fake_kernel.displayed) == 1
+    assert fake_kernel.displayed[0][1] == {"image/png": {"height": 5, "width": 10}}
+
+    # data-uri is kept and displayed
+    fake_kernel.displayed.clear()
+    process_screenshots(fake_kernel, str(tmp_path), False)
+    with open(tmp_path / "output.xml", encoding="utf-8") as fp:
+        assert fp.read() == xml
+    assert len(fake_kernel.displayed) == 1
+
+
+def test_process_screenshots_deduplicated(tmp_path, fake_kernel):
+    Image.new("RGB", (10, 5), "red").save(tmp_path / "a.png")
+    Image.new("RGB", (10, 5), "red").save(tmp_path / "b.png")
+    with open(tmp_path / "output.xml", "w", encoding="utf-8") as fp:
+        fp.write(OUTPUT_XML.replace("shot.png", "a.png") + '<img src="b.png">\n')
+
+    cache = OrderedDict()
+    process_screenshots(fake_kernel, str(tmp_path), False, cache)
+    assert len(fake_kernel.displayed) == 1
+    assert len(cache) == 1
+
+
+def test_process_screenshots_evicted(tmp_path, monkeypatch, fake_kernel):
+    monkeypatch.setattr(executors, "SCREENSHOT_CACHE_SIZE", 1)
+    Image.new("RGB", (10, 5), "red").save(tmp_path / "a.png")
+    Image.new("RGB", (10, 5), "blue").save(tmp_path / "b.png")
+    uris = {}
+    for name in ("a.png", "b.png"):
+        with open(tmp_path / name, "rb") as fp:
+            uris[name] = data_uri("image/png", fp.read())
+    with open(tmp_path / "output.xml", "w", encoding="utf-8") as fp:
+        fp.write('<img src="a.png">\n<img src="b.png">\n<img src="a.png">\n')
+
+    cache = OrderedDict()
+    process_screenshots(fake_kernel, str(tmp_path), False, cache)
+    with open(tmp_path / "output.xml", encoding="utf-8") as fp:
+        assert fp.read().splitlines() == [
+            f'<img src="{uris["a.png"]}">',
+            f'<img src="{uris["b.png"]}">',
+            f'<img src="{uris["a.png"]}">',
+        ]
+    assert len(fake_kernel.displayed) == 2
+    assert len(cache) == 1
+
+
+def test_process_screenshots_downscaled(tmp_path, monkeypatch, fake_kernel):
+    monkeypatch.setattr(executors, "SCREENSHOT_MAX_WIDTH", 4)
+    monkeypatch.setattr(executors, "SCREENSHOT_FORMAT", "JPEG")
+    Image.new("RGBA", (10, 5), "red").save(tmp_path / "shot.png")
+    with open(tmp_path / "output.xml", "w", encoding="utf-8") as fp:
+        fp.write(OUTPUT_XML)
+
+    process_screenshots(fake_kernel, str(tmp_path), False)
+    data, metadata = fake_kernel.displayed[0]
+    assert metadata == {"image/jpeg": {"height": 2, "width": 4}}
+    im = Image.open(BytesIO(base64.b64decode(data["image/jpeg"])))
+    assert (im.format, im.width) == ("JPEG", 4)
+
+
+def test_stop_robot_suite(tmp_path):
+    suite = model.TestSuite(name="Suite")
+    test = suite.tests.create(name="Test")
+    test.body.create_keyword("Sleep", args=["0.5"])
+    test.body.create_keyword("Fail", args=["Not stopped"])
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(
+            suite.run(outputdir=str(tmp_path), output=None, stdout=StringIO())
+        )
+    )
+    thread.start()
+    time.sleep(0.1)
+    stop_robot_suite()
+    thread.join()
+    assert "terminated" in results[0].suite.tests[0].message
+
+
+def test_stop_robot_suite_forcefully(tmp_path):
+    suite = model.TestSuite(name="Suite")
+    test = suite.tests.create(name="Test")
+    test.body.create_keyword("Sleep", args=["10"])
+    results = []
+
+    def run():
+        try:
+            suite.run(outputdir=str(tmp_path), output=None, stdout=StringIO())
+        except KeyboardInterrupt as e:
+            results.append(e)
+
+    thread = threading.Thread(target=run)
+    start = time.monotonic()
+    thread.start()
+    time.sleep(0.1)
+    try:
+        stop_robot_suite(thread.ident)  # waits for the keyword to end
+        time.sleep(0.1)
+        assert thread.is_alive()
+        stop_robot_suite(thread.ident)
+        thread.join(5)
+    finally:
+        # noinspection PyProtectedMember
+        STOP_SIGNAL_MONITOR._signal_count = 0
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 5
+    assert isinstance(results[0], KeyboardInterrupt)
+
+
+def test_call_in_background_refused_while_busy():
+    kernel = DisplayKernel.__new__(DisplayKernel)
+    kernel.background = None
+    kernel.background_future = None
+    kernel.background_thread_id = None
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+        return threading.get_ident()
+
+    future = kernel.submit_to_background(block)
+    started.wait(5)
+    try:
+        with pytest.raises(ExecutionInProgress):
+            kernel.call_in_background(threading.get_ident)
+    finally:
+        release.set()
+    assert future.result() == kernel.background_thread_id
+    assert kernel.call_in_background(threading.get_ident) == future.result()
+    kernel.background.shutdown()
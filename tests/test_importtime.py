@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+
+# Modules, which robotkernel must import on demand only
+LAZY_MODULES = ["PIL", "ipywidgets", "pygments", "lunr", "difflib", "pkg_resources"]
+
+# Modules, which must not be imported at all when starting the kernel (unlike
+# e.g. pygments and difflib, which are imported by IPython itself)
+UNLOADED_MODULES = [
+    "PIL",
+    "ipywidgets",
+    "lunr",
+    "pkg_resources",
+    "robot.libdoc",
+    "selenium",
+    "appium",
+]
+
+# Budget for the cumulative import time of the kernel (with its dependencies)
+IMPORT_TIME_BUDGET_US = 1000000
+
+
+def get_import_times(module):
+    """Return (module, parent, self time, cumulative time in us) for imports."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    ).stderr
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|", 2)
+        depth = len(name) - len(name.lstrip())
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    # Children are listed before their parent, so resolve parents backwards
+    results = []
+    stack = []
+    for name, depth, self_us, cumulative_us in reversed(rows):
+        while stack and stack[-1][1] >= depth:
+            stack.pop()
+        parent = stack[-1][0] if stack else None
+        results.append((name, parent, self_us, cumulative_us))
+        stack.append((name, depth))
+    return results
+
+
+def test_kernel_import_time():
+    imports = get_import_times("robotkernel.kernel")
+    for name, parent, _, _ in imports:
+        if name.split(".")[0] in LAZY_MODULES and parent:
+            assert not parent.startswith("robotkernel"), f"{parent} imports {name}"
+    best = next(us for name, _, _, us in imports if name == "robotkernel.kernel")
+    for _ in range(2):  # best of a few runs to not fail on a busy machine
+        if best < IMPORT_TIME_BUDGET_US:
+            break
+        imports = get_import_times("robotkernel.kernel")
+        best = min(
+            [best] + [us for name, _, _, us in imports if name == "robotkernel.kernel"]
+        )
+    assert best < IMPORT_TIME_BUDGET_US
+
+
+def test_kernel_import_unloaded_modules():
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import robotkernel.kernel, sys; "
+            f"print([m for m in {UNLOADED_MODULES!r} if m in sys.modules])",
+        ],
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    ).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from robotkernel.kernel import RobotKernel
+import pytest
+
+
+@pytest.fixture
+def kernel():
+    kernel = RobotKernel()
+    yield kernel
+    kernel.robot_artifacts.cleanup()
+
+
+def complete_variables(kernel, code):
+    return kernel.do_complete(code, None)["matches"]
+
+
+def test_robot_variables_added(kernel):
+    kernel.update_robot_variables("a", "${foo}  ${bar}")
+    kernel.update_robot_variables("b", "${foo}  @{baz}")
+    assert kernel.robot_variables == {"${foo}": 2, "${bar}": 1, "@{baz}": 1}
+    assert kernel.robot_variable_names == ["${bar}", "${foo}", "@{baz}"]
+
+
+def test_robot_variables_replaced(kernel):
+    kernel.update_robot_variables("a", "${foo}  ${bar}")
+    kernel.update_robot_variables("b", "${foo}")
+    kernel.update_robot_variables("a", "${qux}")
+    assert kernel.robot_variables == {"${foo}": 1, "${qux}": 1}
+    assert kernel.robot_variable_names == ["${foo}", "${qux}"]
+    assert sorted(complete_variables(kernel, "Log  ${")) == ["${foo}", "${qux}"]
+
+
+def test_robot_variables_deleted(kernel):
+    kernel.robot_history["a"] = "${foo}  ${bar}"
+    kernel.update_robot_variables("a", "${foo}  ${bar}")
+    kernel.update_robot_variables("b", "${foo}")
+    kernel.init_metadata({"header": {}, "metadata": {"deletedCells": ["a"]}})
+    assert "a" not in kernel.robot_history
+    assert kernel.robot_variables == {"${foo}": 1}
+    assert kernel.robot_variable_names == ["${foo}"]
+    assert complete_variables(kernel, "Log  ${") == ["${foo}"]
+
+
+def test_robot_variables_buffer(kernel):
+    kernel.update_robot_variables("a", "${foo}")
+    code = "${bar}  1\nLog  ${"
+    assert sorted(complete_variables(kernel, code)) == ["${bar}", "${foo}"]
+    scanned = kernel.robot_buffer_variables
+    code = "${bar}  1\nLog  ${ba"
+    assert complete_variables(kernel, code) == ["${bar}"]
+    assert kernel.robot_buffer_variables["${bar}  1"] is scanned["${bar}  1"]
+    assert list(kernel.robot_buffer_variables) == ["${bar}  1", "Log  ${ba"]
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from io import StringIO
+from robot.running import model
+from robotkernel import listeners
+from robotkernel.utils import KeywordNames
+from robotkernel.utils import LunrIndex
+import os
+import sys
+import threading
+
+
+def test_libdoc_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(listeners, "LIBDOC_CACHE_DIR", str(tmp_path))
+    path = listeners.get_libdoc_cache_path("Collections")
+    assert path is not None and path.startswith(str(tmp_path))
+    assert not os.path.exists(path)
+
+    lib_doc = listeners.get_library_documentation("Collections")
+    assert os.path.exists(path)
+
+    cached = listeners.get_library_documentation("Collections")
+    assert [kw.name for kw in cached.keywords] == [kw.name for kw in lib_doc.keywords]
+
+
+def test_libdoc_cache_package(tmp_path, monkeypatch):
+    monkeypatch.setattr(listeners, "LIBDOC_CACHE_DIR", str(tmp_path / "cache"))
+    package = tmp_path / "LocalPackage"
+    package.mkdir()
+    (package / "__init__.py").write_text("from .keywords import KeywordsLibrary\n")
+    (package / "keywords.py").write_text(
+        "class KeywordsLibrary:\n    def first(self):\n        pass\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    source = str(package / "__init__.py")
+    path = listeners.get_libdoc_cache_path("LocalPackage.KeywordsLibrary", source)
+    listeners.get_library_documentation("LocalPackage.KeywordsLibrary", source)
+    assert os.path.exists(path)
+
+    # Editing any module of the package invalidates the cache
+    (package / "keywords.py").write_text(
+        "class KeywordsLibrary:\n    def second(self):\n        pass\n"
+    )
+    os.utime(package / "keywords.py", (0, os.path.getmtime(path) + 10))
+    assert (
+        listeners.get_libdoc_cache_path("LocalPackage.KeywordsLibrary", source) != path
+    )
+
+
+def test_library_source_not_imported(tmp_path, monkeypatch):
+    package = tmp_path / "UnimportedPackage"
+    (package / "sub").mkdir(parents=True)
+    (package / "__init__.py").write_text("raise ImportError('imported')\n")
+    (package / "sub" / "__init__.py").write_text("")
+    (package / "sub" / "keywords.py").write_text("class Keywords:\n    pass\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    source = str(package / "sub" / "keywords.py")
+    name = "UnimportedPackage.sub.keywords"
+    assert listeners.get_library_source(name) == source
+    assert listeners.get_library_source(f"{name}.Keywords") == source
+    source = str(package / "__init__.py")
+    assert listeners.get_library_source("UnimportedPackage.Missing") == source
+    assert "UnimportedPackage" not in sys.modules
+
+
+def test_source_mtime_package_modules_only(tmp_path):
+    package = tmp_path / "LocalPackage"
+    (package / "node_modules").mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    (package / "data.json").write_text("{}")
+    (package / "node_modules" / "index.js").write_text("")
+    mtime = listeners.get_source_mtime(str(package / "__init__.py"))
+    os.utime(package / "data.json", (0, mtime + 10))
+    os.utime(package / "node_modules" / "index.js", (0, mtime + 10))
+    os.utime(package / "node_modules", (0, mtime + 10))
+    assert listeners.get_source_mtime(str(package / "__init__.py")) == mtime
+
+
+def test_libdoc_cache_disabled(monkeypatch):
+    monkeypatch.setattr(listeners, "LIBDOC_CACHE_DIR", "")
+    assert listeners.get_libdoc_cache_path("Collections") is None
+    assert listeners.get_library_documentation("Collections").keywords
+
+
+RETURN_VALUES = """\
+*** Test Cases ***
+Nested keywords
+    Nested
+    Capture Page Screenshot
+
+Loop as the last step
+    Evaluate    "before"
+    FOR    ${i}    IN RANGE    3
+        Evaluate    ${i} * 10
+    END
+
+Condition as the last step
+    Evaluate    "before"
+    IF    True
+        Evaluate    "if"
+    END
+
+Loop and screenshot as the last step
+    Evaluate    "before"
+    FOR    ${i}    IN RANGE    2
+        Nested
+    END
+    Capture Page Screenshot
+
+*** Keywords ***
+Nested
+    Evaluate    "inner"
+    RETURN    outer
+
+Capture Page Screenshot
+    ${value}=    Evaluate    "screenshot"
+    RETURN    ${value}
+"""
+
+
+def test_return_value_listener(tmp_path):
+    suite = model.TestSuite.from_string(RETURN_VALUES)
+    values = []
+    listener = listeners.ReturnValueListener(values.append)
+    suite.run(
+        outputdir=str(tmp_path),
+        output=None,
+        log=None,
+        report=None,
+        stdout=StringIO(),
+        listener=[listener],
+    )
+    # Only top-level keywords are displayed, but not screenshot keywords
+    assert values == ["outer", "before", "before", "before"]
+
+
+def test_keywords_indexer_concurrent_updates():
+    catalog = {
+        "index": LunrIndex("dottedname", ["dottedname", "name"]),
+        "names": KeywordNames(),
+        "libraries": [],
+        "keywords": {},
+    }
+    indexer = listeners.RobotKeywordsIndexerListener(catalog)
+
+    def update(name):
+        indexer._update_catalog(
+            name, [{"name": "Keyword", "dottedname": f"{name}.Keyword"}]
+        )
+
+    threads = [threading.Thread(target=update, args=(f"L{i}",)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(catalog["index"].segments) == 20
+    assert len(catalog["names"].segments) == 20
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from io import StringIO
+from robotkernel.listeners import RobotVariablesListener
+from robotkernel.parallel import merge_outputs
+from robotkernel.parallel import run_in_processes
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+CODE = """\
+*** Test Cases ***
+First
+    Log  <img src="shot.png">  html=True
+    Set suite variable  ${FIRST}  ${VALUE}
+
+Second
+    Should be equal  ${VALUE}  value
+"""
+
+
+def test_run_in_processes(tmp_path):
+    stdout = StringIO()
+    variables = {"${VALUE}": "value"}
+    result = run_in_processes(
+        CODE,
+        OrderedDict(),
+        2,
+        str(tmp_path),
+        stdout,
+        [RobotVariablesListener(variables)],
+        "INFO",
+    )
+    assert [test.name for test in result.suite.tests] == ["First", "Second"]
+    assert result.statistics.total.passed == 2
+    assert os.path.exists(tmp_path / "output.xml")
+    assert variables["${FIRST}"] == "value"
+    with open(tmp_path / "output.xml", encoding="utf-8") as fp:
+        assert 'src="test-0/shot.png"' in fp.read()
+    assert "First" in stdout.getvalue() and "Second" in stdout.getvalue()
+
+
+def test_run_in_processes_crashed(tmp_path):
+    code = """\
+*** Test Cases ***
+First
+    Evaluate  os._exit(1)  modules=os
+
+Second
+    No operation
+"""
+    stdout = StringIO()
+    result = run_in_processes(code, OrderedDict(), 2, str(tmp_path), stdout, [], "INFO")
+    assert [test.name for test in result.suite.tests] == ["First", "Second"]
+    assert result.suite.tests[0].status == "FAIL"
+    assert "BrokenProcessPool" in result.suite.tests[0].message
+    assert "BrokenProcessPool" in stdout.getvalue()
+    assert os.path.exists(tmp_path / "output.xml")
+
+
+def test_run_in_processes_interrupted(tmp_path):
+    code = """\
+*** Test Cases ***
+First
+    No operation
+
+Second
+    Sleep  2
+    [Teardown]  Sleep  0.5
+"""
+
+    def interrupt():
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and not (
+            os.path.exists(tmp_path / "test-0" / "output.xml")
+            and os.path.exists(tmp_path / "test-1")
+        ):
+            time.sleep(0.05)
+        time.sleep(0.2)  # while the second test is sleeping in the other process
+        for process in multiprocessing.active_children():
+            os.kill(process.pid, signal.SIGINT)
+
+    thread = threading.Thread(target=interrupt)
+    thread.start()
+    try:
+        result = run_in_processes(
+            code, OrderedDict(), 2, str(tmp_path), StringIO(), [], "INFO"
+        )
+    finally:
+        thread.join()
+    assert [test.status for test in result.suite.tests] == ["PASS", "FAIL"]
+    assert "terminated by signal" in result.suite.tests[1].message
+
+
+def test_merge_outputs_empty(tmp_path):
+    result = merge_outputs([], str(tmp_path / "output.xml"), "Suite")
+    assert result.suite.name == "Suite"
+    assert not result.suite.tests
+    assert os.path.exists(tmp_path / "output.xml")
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+from robotkernel.selectors import clear_selector_highlights
+from robotkernel.selectors import get_selector_completions
+from robotkernel.selectors import get_selenium_css_selector_completions
+from robotkernel.selectors import get_selenium_id_selector_completions
+from robotkernel.selectors import get_selenium_link_selector_completions
+from robotkernel.selectors import get_selenium_xpath_selector_completions
+from robotkernel.selectors import highlight_selector_completions
+from robotkernel.selectors import SELECTOR_CLEAR_SCRIPT
+from robotkernel.selectors import SELECTOR_QUERY_SCRIPT
+from robotkernel.selectors import SelectorCompleter
+import threading
+import time
+
+
+class FakeDriver:
+    def __init__(self, records):
+        self.records = records
+        self.state = ["http://localhost/", "page", 0]
+        self.injected = False
+        self.highlights = []
+        self.calls = []
+        self.mutations = 0  # between calls
+
+    def execute_script(self, script, *args):
+        self.state = self.state[:2] + [self.state[2] + self.mutations]
+        if script == SELECTOR_CLEAR_SCRIPT:
+            self.calls.append(args)
+            self.highlights = []
+            return None
+        strategy, needle, simmer, state, highlights = args
+        self.calls.append(args)
+        if script != SELECTOR_QUERY_SCRIPT:
+            self.injected = True
+        elif not self.injected:
+            return {"inject": True}
+        if strategy and state != self.state:
+            return {"state": self.state, "records": self.records}
+        if highlights is not None:
+            self.highlights = highlights
+        return {"state": self.state, "records": None}
+
+
+def record(element, tag="div", id="", name="", text="", visible=True, simmer=""):
+    return dict(
+        element=element,
+        id=id,
+        name=name,
+        tag=tag,
+        text=text,
+        visible=visible,
+        simmer=simmer,
+    )
+
+
+def test_id_selector_completions():
+    driver = FakeDriver(
+        [
+            record(1, id="first"),
+            record(2, id="second", visible=False),
+            record(3, id="fi"),
+            record(4),
+        ]
+    )
+    assert get_selenium_id_selector_completions("id:", driver) == [
+        ("id:first", 1),
+        ("id:fi", 3),
+    ]
+    assert get_selenium_id_selector_completions("id:fi", driver) == [("id:fi", 3)]
+    assert get_selenium_id_selector_completions("id:fir", driver) == [("id:first", 1)]
+    assert driver.calls[0] == ("snapshot", "", False, None, None)
+
+
+def test_css_selector_completions():
+    driver = FakeDriver(
+        [
+            record(1, id="first"),
+            record(2, tag="input", name="q"),
+            record(3, tag="a", text="Home"),
+            record(4, simmer="div > span"),
+            record(5),
+        ]
+    )
+    assert get_selenium_css_selector_completions("css:.item", driver) == [
+        ("id:first", 1),
+        ("name:q", 2),
+        ("link:Home", 3),
+        ("css:div > span", 4),
+    ]
+    assert len(driver.calls) == 1
+    # Simmer selectors are computed only for the unresolved elements
+    assert driver.calls[0][2] == "links"
+    get_selenium_css_selector_completions("css:div .item", driver)
+    assert driver.calls[-1][2] == "all"
+
+
+def test_xpath_selector_completions():
+    driver = FakeDriver([record(1, tag="a", text="Home", simmer="a"), record(2)])
+    assert get_selenium_xpath_selector_completions("xpath://a", driver) == [
+        ("css:a", 1)
+    ]
+    assert driver.calls[-1][2] == "unresolved"
+    assert get_selenium_xpath_selector_completions("xpath:", FakeDriver([])) == []
+
+
+def test_selector_snapshot_cache():
+    cache = {}
+    driver = FakeDriver([record(1, tag="a", text="Home"), record(2, tag="a")])
+    assert get_selenium_link_selector_completions("link:H", driver, cache) == [
+        ("link:Home", 1)
+    ]
+    assert driver.calls[-1][3] is None
+
+    # Unchanged page is filtered from the cached snapshot
+    driver.records = None
+    assert get_selenium_link_selector_completions("link:Ho", driver, cache) == [
+        ("link:Home", 1)
+    ]
+    assert len(driver.calls) == 1
+
+    # Mutated page is queried again on verifying the cached results
+    driver.state = ["http://localhost/", "page", 1]
+    driver.records = [record(3, tag="a", text="Home")]
+    assert not highlight_selector_completions(driver, [("link:Home", 1)], cache)
+    assert get_selenium_link_selector_completions("link:Hom", driver, cache) == [
+        ("link:Home", 3)
+    ]
+    assert cache[driver]["state"] == driver.state
+    assert driver.highlights == []
+
+
+def test_selector_completions_highlight():
+    cache = {}
+    driver = FakeDriver([record(1, id="first"), record(2, id="second")])
+    assert get_selector_completions("id:fi", driver, cache) == ["id:first"]
+    assert driver.highlights == [[1, "id:first"]]
+    # Supporting scripts were injected with the query, which was highlighted
+    assert len(driver.calls) == 2
+
+    # Cached results are highlighted in the same call verifying them
+    assert get_selector_completions("id:sec", driver, cache) == ["id:second"]
+    assert driver.highlights == [[2, "id:second"]]
+    assert len(driver.calls) == 3
+
+    # Results are queried again and highlighted when the page has changed
+    driver.state = ["http://localhost/", "page", 1]
+    driver.records = [record(3, id="second")]
+    assert get_selector_completions("id:se", driver, cache) == ["id:second"]
+    assert driver.highlights == [[3, "id:second"]]
+    assert len(driver.calls) == 5
+
+    # Supporting scripts are injected again into a new page
+    driver.injected = False
+    driver.state = ["http://localhost/other", "other", 0]
+    assert get_selector_completions("id:se", driver, cache) == ["id:second"]
+    assert driver.highlights == [[3, "id:second"]]
+
+
+def test_selector_completions_mutating_page():
+    cache = {}
+    driver = FakeDriver([record(1, id="first"), record(2, id="second")])
+    driver.mutations = 1
+
+    # Results of the failed verification are highlighted without verifying
+    assert get_selector_completions("id:fi", driver, cache) == ["id:first"]
+    assert driver.highlights == [[1, "id:first"]]
+    assert len(driver.calls) == 3
+    assert cache[driver]["volatile"]
+
+    # Page is then queried again at once instead of using the snapshot
+    assert get_selector_completions("id:sec", driver, cache) == ["id:second"]
+    assert driver.highlights == [[2, "id:second"]]
+    assert len(driver.calls) == 5
+    assert driver.calls[3][3] is None and driver.calls[4][0] is None
+
+    # Until the page is found unchanged between two queries
+    driver.mutations = 0
+    assert get_selector_completions("id:fi", driver, cache) == ["id:first"]
+    assert not cache[driver]["volatile"]
+    assert len(driver.calls) == 7
+    assert get_selector_completions("id:sec", driver, cache) == ["id:second"]
+    assert driver.highlights == [[2, "id:second"]]
+    assert len(driver.calls) == 8
+
+
+def test_clear_selector_highlights():
+    cache = {}
+    driver = FakeDriver([record(1, id="first")])
+    clear_selector_highlights(driver, cache)
+    assert driver.calls == []
+
+    get_selector_completions("id:fi", driver, cache)
+    assert cache[driver]["highlighted"]
+    calls = len(driver.calls)
+    clear_selector_highlights(driver, cache)
+    assert driver.highlights == []
+    assert len(driver.calls) == calls + 1
+
+    # Nothing to clear until highlighted again
+    clear_selector_highlights(driver, cache)
+    assert len(driver.calls) == calls + 1
+
+
+class SlowDriver(FakeDriver):
+    def __init__(self, records):
+        super().__init__(records)
+        self.event = threading.Event()
+
+    def execute_script(self, script, *args):
+        self.event.wait(5)
+        return super().execute_script(script, *args)
+
+
+def test_selector_completer_deadline():
+    completer = SelectorCompleter(0.05)
+    driver = SlowDriver([record(1, id="first"), record(2, id="fine")])
+    try:
+        assert completer.complete("id:fi", driver, {}) == []
+        driver.event.set()
+        completer.pending[2].result(5)
+        # Results of the same needle finished after the deadline
+        assert completer.complete("id:fi", driver, {}) == ["id:first", "id:fine"]
+
+        # Matching results of the previous needle until the deadline
+        driver.event.clear()
+        assert completer.complete("id:fir", driver, {}) == ["id:first"]
+
+        # Superseded completion is not highlighted
+        highlights = driver.highlights
+        future = completer.pending[2]
+        completer.cancel()
+        driver.event.set()
+        assert future.result(5) == ["id:first"]
+        assert driver.highlights == highlights == [[1, "id:first"], [2, "id:fine"]]
+    finally:
+        driver.event.set()
+        completer.shutdown()
+
+
+def test_selector_completer_idle():
+    completer = SelectorCompleter(0.05)
+    driver = SlowDriver([record(1, id="first")])
+    try:
+        assert completer.complete("id:fi", driver, {}) == []
+        future = completer.pending[2]
+        # Drivers are not free while a WebDriver command is running
+        with completer.idle(0.05) as idle:
+            assert not idle
+        driver.event.set()
+        future.result(5)
+        with completer.idle(0.05) as idle:
+            assert idle
+            # Previous results are returned at once while the lock is held
+            driver.event.clear()
+            calls = len(driver.calls)
+            start = time.monotonic()
+            assert completer.complete("id:fir", driver, {}) == ["id:first"]
+            assert completer.complete("id:x", driver, {}) == []
+            assert time.monotonic() - start < 0.05
+            assert completer.pending is None
+
+        # Completion cancelled while waiting for the lock is not run
+        with completer.lock:
+            assert completer.complete("id:first", driver, {}) == ["id:first"]
+            future = completer.pending[2]
+            completer.cancel()
+        assert future.result(5) == ["id:first"]
+        assert len(driver.calls) == calls
+    finally:
+        driver.event.set()
+        completer.shutdown()
@@ -1,5 +1,15 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
 from robotkernel.utils import detect_robot_context
+from robotkernel import utils
+from robotkernel.utils import get_cached_keyword_doc
+from robotkernel.utils import get_lunr_completions
+from robotkernel.utils import get_lunr_results
+from robotkernel.utils import KeywordNames
+from robotkernel.utils import LunrIndex
+from robotkernel.utils import normalize_keyword
+from robotkernel.utils import scored_results
+from types import SimpleNamespace
 
 
 def test_detect_robot_context_root():
@@ -95,3 +105,179 @@ This is a task
 # *** Keywords ***
 # """, -1
 #     ) == '__keywords__'
+
+
+def test_lunr_index_segments():
+    index = LunrIndex("dottedname", ["dottedname", "name"])
+    index.update("A", [{"name": "Open Browser", "dottedname": "A.Open Browser"}])
+    index.update("B", [{"name": "Open File", "dottedname": "B.Open File"}])
+    assert len(index) == 2
+    assert {r["ref"] for r in index.search("open")} == {
+        "A.Open Browser",
+        "B.Open File",
+    }
+
+    segment = index.segments["A"]
+    index.update("A", [{"name": "Open Browser", "dottedname": "A.Open Browser"}])
+    assert index.segments["A"] is segment
+
+    index.update("B", [{"name": "Close File", "dottedname": "B.Close File"}])
+    assert [r["ref"] for r in index.search("open")] == ["A.Open Browser"]
+
+    index.update("B", [])
+    assert "B" not in index.segments
+    assert len(index) == 1
+
+
+def test_scored_results():
+    results = [
+        {"ref": "Log"},
+        {"ref": "Log Many"},
+        {"ref": "Sleep"},
+        {"ref": "Catenate"},
+    ]
+    assert [r["ref"] for r in scored_results("log", results)] == [
+        "Log",
+        "Log Many",
+        "Sleep",
+        "Catenate",
+    ]
+    assert scored_results("lo", results)[0] is results[0]
+    assert "score" not in results[0]
+    assert [r["ref"] for r in scored_results("many", results, 2)] == [
+        "Log Many",
+        "Catenate",
+    ]
+
+
+def test_lunr_results_cache():
+    index = LunrIndex("dottedname", ["dottedname", "name"])
+    names = ["Log", "Log Many", "Catenate"]
+    index.update("A", [{"name": n, "dottedname": f"A.{n}"} for n in names])
+    keywords = {f"A.{n}": SimpleNamespace(name=n) for n in names}
+    catalog = {"index": index, "keywords": keywords, "names": KeywordNames()}
+    catalog["names"].update("A", [(f"A.{n}", n) for n in names])
+    searches = []
+    search = index.search
+    index.search = lambda query: searches.append(query) or search(query)
+    cache = OrderedDict()
+
+    assert {r["ref"] for r in get_lunr_results("lo", catalog, cache)} == {
+        "A.Log",
+        "A.Log Many",
+    }
+    assert len(searches) == 1
+    assert [r["ref"] for r in get_lunr_results("log m", catalog, cache)]
+    assert len(searches) == 2
+    assert [r["ref"] for r in get_lunr_results("log", catalog, cache)]
+    assert len(searches) == 2
+    # narrowed like keyword names are completed, ignoring spaces
+    assert [r["ref"] for r in get_lunr_results("logm", catalog, cache)] == [
+        "A.Log Many"
+    ]
+    assert len(searches) == 2
+
+    index.update("B", [{"name": "Login", "dottedname": "B.Login"}])
+    keywords["B.Login"] = SimpleNamespace(name="Login")
+    catalog["names"].update("B", [("B.Login", "Login")])
+    assert "B.Login" in {r["ref"] for r in get_lunr_results("log", catalog, cache)}
+    assert len(searches) == 3
+
+
+def test_lunr_results_narrowed_like_searched():
+    index = LunrIndex("dottedname", ["dottedname", "name"])
+    names = ["Log", "Log Many", "Foo Log Many", "Should Be Equal", "Catenate"]
+    index.update("A", [{"name": n, "dottedname": f"A.{n}"} for n in names])
+    index.update("B", [{"name": "Login", "dottedname": "B.Login"}])
+    keywords = {f"A.{n}": SimpleNamespace(name=n) for n in names}
+    keywords["B.Login"] = SimpleNamespace(name="Login")
+    catalog = {"index": index, "keywords": keywords, "names": KeywordNames()}
+    catalog["names"].update("A", [(f"A.{n}", n) for n in names])
+    catalog["names"].update("B", [("B.Login", "Login")])
+    for needle in ["logm", "a.log", "a.logma", "shou", "shouldbe", "many", "cat"]:
+        cache = OrderedDict()
+        for size in range(1, len(needle) + 1):
+            narrowed = get_lunr_results(needle[:size], catalog, cache)
+        searched = get_lunr_results(needle, catalog)
+        assert sorted(r["ref"] for r in narrowed) == sorted(
+            r["ref"] for r in searched
+        ), needle
+    assert [r["ref"] for r in get_lunr_results("logm", catalog)] == ["A.Log Many"]
+
+
+def test_lunr_completions_context_before_limit(monkeypatch):
+    monkeypatch.setattr(utils, "MAX_COMPLETIONS", 2)
+    index = LunrIndex("dottedname", ["dottedname", "name"])
+    refs = [
+        "__settings__.Log",
+        "__settings__.Logs",
+        "LongLibraryName.Log Many",
+        "LongLibraryName.Logs",
+    ]
+    index.update("A", [{"name": r.split(".")[-1], "dottedname": r} for r in refs])
+    keywords = {r: SimpleNamespace(name=r.split(".")[-1]) for r in refs}
+    catalog = {"index": index, "keywords": keywords, "names": KeywordNames()}
+    assert sorted(get_lunr_completions("log", catalog, "__tasks__")) == [
+        "Log many",
+        "Logs",
+    ]
+
+
+def test_keyword_names():
+    names = KeywordNames()
+    names.update("BuiltIn", [("BuiltIn.Log", "Log"), ("BuiltIn.Log Many", "Log Many")])
+    names.update("__suite__", [("Log", "Log"), ("Catenate", "Catenate")])
+    assert names.find("log") == "Log"
+    assert names.find("builtin.log") == "BuiltIn.Log"
+    assert names.find("log_many") == "BuiltIn.Log Many"
+    assert names.find("LogMany") == "BuiltIn.Log Many"
+    assert names.find("log more") is None
+    assert names.find("") is None
+    assert names.complete("Log") == ["Log", "BuiltIn.Log", "BuiltIn.Log Many"]
+    assert names.complete("built in.log m") == ["BuiltIn.Log Many"]
+    assert names.complete("") == []
+
+    names.update("__suite__", [])
+    assert names.find("log") == "BuiltIn.Log"
+    assert "__suite__" not in names.segments
+    assert "catenate" not in names.names
+
+
+def test_keyword_names_incremental():
+    updates = [
+        ("A", [("A.Log", "Log"), ("A.Sleep", "Sleep")]),
+        ("B", [("B.Log", "Log"), ("B.Wait", "Wait")]),
+        ("__suite__", [("Log", "Log")]),
+        ("A", [("A.Log", "Log"), ("A.Run", "Run")]),
+        ("C", [("Log", "Log")]),
+        ("B", []),
+    ]
+    names = KeywordNames()
+    current = {}
+    for name, keywords in updates:
+        names.update(name, keywords)
+        current[name] = keywords
+        expected = {}
+        for segment_keywords in current.values():
+            for ref, keyword_name in segment_keywords:
+                pairs = [(keyword_name, ref != keyword_name)]
+                if ref != keyword_name:
+                    pairs.append((ref, True))
+                for pair_name, is_library in pairs:
+                    normalized = normalize_keyword(pair_name)
+                    expected.setdefault(normalized, []).append((is_library, ref))
+        assert names.refs == {key: sorted(value) for key, value in expected.items()}
+        assert names.names == sorted(expected)
+    assert names.complete("log") == ["Log", "Log", "A.Log"]
+
+
+def test_cached_keyword_doc():
+    cache = OrderedDict()
+    keyword = SimpleNamespace(name="Log", args=["message"], doc="Logs message.")
+    doc = get_cached_keyword_doc("BuiltIn.Log", keyword, cache)
+    assert doc["text/plain"].startswith("Log message")
+    assert get_cached_keyword_doc("BuiltIn.Log", keyword, cache) is doc
+
+    keyword = SimpleNamespace(name="Log", args=[], doc="Logs.")
+    assert get_cached_keyword_doc("BuiltIn.Log", keyword, cache) is not doc
+    assert len(cache) == 1
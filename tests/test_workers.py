@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from io import StringIO
+from robotkernel import listeners
+from robotkernel.executors import execute_python
+from robotkernel.executors import execute_robot
+from robotkernel.listeners import ReturnValueListener
+from robotkernel.listeners import RobotKeywordsIndexerListener
+from robotkernel.listeners import RobotVariablesListener
+from robotkernel.listeners import StatusEventListener
+from robotkernel.listeners import WhiteLibraryListener
+from robotkernel.utils import KeywordNames
+from robotkernel.utils import LunrIndex
+from robotkernel.workers import RobotWorker
+from robotkernel.workers import WorkerError
+import os
+import pytest
+import sys
+
+CODE = """\
+*** Test Cases ***
+Test
+    Should be equal  ${VALUE}  value
+    Set suite variable  ${PID}  ${{os.getpid()}}
+    Create list  a  b
+"""
+
+
+def test_robot_worker(tmp_path):
+    worker = RobotWorker()
+    try:
+        events = []
+        return_values = []
+        variables = {"${VALUE}": "value"}
+        result = worker.run(
+            CODE,
+            OrderedDict(),
+            str(tmp_path),
+            StringIO(),
+            [
+                RobotVariablesListener(variables),
+                StatusEventListener(events.append),
+                ReturnValueListener(return_values.append),
+            ],
+            "INFO",
+        )
+        assert result.statistics.total.passed == 1
+        assert {"test": "Test"} in events
+        assert return_values == [["a", "b"]]
+        assert variables["${PID}"] == worker.process.pid != os.getpid()
+
+        with pytest.raises(WorkerError):
+            worker.run(
+                "*** Test Cases ***\nTest\n    Evaluate  os._exit(1)\n",
+                OrderedDict(),
+                str(tmp_path),
+                StringIO(),
+                [],
+                "INFO",
+            )
+        assert not worker.alive
+    finally:
+        worker.close()
+
+
+WHITE_LIBRARY = """\
+import os
+
+
+class WhiteLibrary:
+    ROBOT_LIBRARY_SCOPE = "GLOBAL"
+
+    def __init__(self):
+        self.app = None
+
+    def launch_application(self):
+        self.app = os.getpid()
+
+    def application_should_be_running(self):
+        assert self.app == os.getpid(), "Application is not running."
+"""
+
+
+def test_robot_worker_shared_connection(tmp_path, monkeypatch, fake_kernel):
+    (tmp_path / "WhiteLibrary.py").write_text(WHITE_LIBRARY)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    connections = []
+    history = OrderedDict()
+    cells = [
+        "*** Settings ***\nLibrary  WhiteLibrary\n\n"
+        "*** Test Cases ***\nFirst\n    Launch application\n",
+        "*** Test Cases ***\nSecond\n    Application should be running\n",
+    ]
+    worker = RobotWorker()
+    try:
+        for cell_id, code in enumerate(cells):
+            reply = execute_robot(
+                fake_kernel,
+                code,
+                history,
+                [WhiteLibraryListener(connections)],
+                True,
+                worker=worker,
+            )
+            assert reply["status"] == "ok", reply
+            history[str(cell_id)] = code
+        assert connections[0]["instance"][0] == os.getpid()
+    finally:
+        worker.close()
+
+
+def test_robot_worker_inline_library(tmp_path, fake_kernel):
+    code = "class InlineLib:\n    def inline_keyword(self):\n        return 'ok'\n"
+    assert execute_python(fake_kernel, code, "InlineLib", True)["status"] == "ok"
+    worker = RobotWorker()
+    try:
+        reply = execute_robot(
+            fake_kernel,
+            "*** Settings ***\nLibrary  InlineLib\n\n"
+            "*** Test Cases ***\nTest\n    Inline keyword\n",
+            OrderedDict(),
+            [],
+            True,
+            worker=worker,
+        )
+        assert reply["status"] == "ok", reply
+    finally:
+        worker.close()
+        del sys.modules["InlineLib"]
+
+
+def test_robot_worker_documents_libraries(tmp_path, monkeypatch, fake_kernel):
+    (tmp_path / "WorkerLib.py").write_text("def worker_keyword():\n    pass\n")
+    monkeypatch.setattr(listeners, "LIBDOC_CACHE_DIR", "")
+    catalog = {
+        "index": LunrIndex("dottedname", ["dottedname", "name"]),
+        "names": KeywordNames(),
+        "libraries": [],
+        "keywords": {},
+    }
+    worker = RobotWorker()
+    try:
+        reply = execute_robot(
+            fake_kernel,
+            f"*** Settings ***\nLibrary  {tmp_path / 'WorkerLib.py'}\n\n"
+            "*** Test Cases ***\nTest\n    Worker keyword\n",
+            OrderedDict(),
+            [RobotKeywordsIndexerListener(catalog)],
+            True,
+            worker=worker,
+        )
+        assert reply["status"] == "ok", reply
+    finally:
+        worker.close()
+    # Indexed from the documentation of the worker without importing here
+    assert "WorkerLib.Worker Keyword" in catalog["keywords"]
+    assert "WorkerLib" not in sys.modules